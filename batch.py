@@ -0,0 +1,194 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import resource
+import signal
+import sys
+import time
+
+from main import TIE_BREAKERS, a_star, bidirectional_search, bounded_a_star, get_heuristic, ida_star
+from puzzle_io import PUZZLE_MAGIC, PuzzleFile, read_puzzle, write_solution
+
+# Non interactive batch solver, reads every instance of one or more files written like instances.py, solves them in a
+# pool of processes (every instance in a new process with its own time and memory limit) and writes one JSON line per
+# instance as soon as it is done:
+#   python batch.py instances.py --workers 4 --time-limit 60 --memory-limit 2048 --output results.jsonl
+
+INSTANCES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instances.py")
+
+# The header line of an instance, for example ##########################3################################
+HEADER = re.compile(r'^#+\s*(\d+)\s*#+\s*$', re.M)
+# A "name = value" line inside an instance
+FIELD = re.compile(r'^(\w+)\s*=\s*', re.M)
+
+ALGORITHMS = {
+    'a_star': a_star,
+    'ida_star': ida_star,
+    'bounded_a_star': bounded_a_star,
+    'bidirectional': bidirectional_search,
+}
+
+# The part of the memory limit the node table of bounded_a_star may take, the rest is left for Python itself and for
+# the error of the node size estimate
+BOUNDED_SHARE = 0.5
+
+
+class TimeLimitExceeded(Exception):
+    pass
+
+
+# Returns the text from the bracket at start up to the bracket that closes it, the value can span several lines
+def bracketed(text, start):
+    depth = 0
+    for index in range(start, len(text)):
+        if text[index] == '[':
+            depth += 1
+        elif text[index] == ']':
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    raise ValueError("Unbalanced brackets in instance starting with {}".format(text[start:start + 30]))
+
+
+# Parses the instance blocks of a text in the instances.py format, returns a list of dicts with the instance number,
+# the puzzle string ("init") and the other fields of the block (empty, full, size, colors)
+def parse_instances(text, source="<string>"):
+    instances = []
+    headers = list(HEADER.finditer(text))
+    for number, header in enumerate(headers):
+        end = headers[number + 1].start() if number + 1 < len(headers) else len(text)
+        block = text[header.end():end]
+        instance = {'id': int(header.group(1)), 'source': source}
+        for field in FIELD.finditer(block):
+            if block.startswith('[', field.end()):
+                value = bracketed(block, field.end())
+            else:
+                value = block[field.end():].split('\n', 1)[0].strip()
+                value = int(value) if value.isdigit() else value
+            instance[field.group(1)] = value
+        if 'init' in instance:
+            instances.append(instance)
+    return instances
+
+
+# The instances of a file in the instances.py format or of a binary puzzle file (see puzzle_io), the instances of a
+# binary file are numbered from 0 and hold the PackedPuzzle itself ("puzzle") instead of its string
+def read_instances(path):
+    with open(path, 'rb') as file:
+        binary = file.read(len(PUZZLE_MAGIC)) == PUZZLE_MAGIC
+    if binary:
+        with PuzzleFile(path) as puzzles:
+            return [{'id': index, 'source': path, 'puzzle': puzzle} for index, puzzle in enumerate(puzzles)]
+    with open(path) as file:
+        return parse_instances(file.read(), path)
+
+
+def on_alarm(signum, frame):
+    raise TimeLimitExceeded()
+
+
+# Solves a single instance inside a pool process, returns the result line as a dict
+def solve_instance(task):
+    instance, options = task
+    result = {'source': instance['source'], 'instance': instance['id'], 'algorithm': options['algorithm']}
+    if options['memory_limit']:
+        limit = options['memory_limit'] * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if options['time_limit']:
+        signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, options['time_limit'])
+
+    stats = {}
+    start_time = time.perf_counter()
+    try:
+        puzzle = instance['puzzle'] if 'puzzle' in instance else read_puzzle(instance['init'], strict=True)
+        if options['algorithm'] == 'a_star':
+            path = a_star(puzzle, options['tie_break'], options['heuristic'], stats=stats)
+        elif options['algorithm'] == 'bounded_a_star':
+            max_bytes = int(options['memory_limit'] * 1024 * 1024 * BOUNDED_SHARE) if options['memory_limit'] else None
+            path = bounded_a_star(puzzle, max_bytes=max_bytes, heuristic=options['heuristic'],
+                                  tie_break=options['tie_break'], stats=stats)
+        elif options['algorithm'] == 'bidirectional':
+            path = bidirectional_search(puzzle, stats=stats)
+        else:
+            path = ALGORITHMS[options['algorithm']](puzzle, options['heuristic'], stats=stats)
+        result['status'] = 'solved' if path else 'unsolvable'
+        if path:
+            result['moves'] = len(path)
+            if options['plan']:
+                result['plan'] = list(path)
+            if options['solutions']:
+                name = "{}-{}.lqsl".format(os.path.splitext(os.path.basename(instance['source']))[0], instance['id'])
+                write_solution(os.path.join(options['solutions'], name), path)
+    except TimeLimitExceeded:
+        result['status'] = 'timeout'
+    except MemoryError:
+        result['status'] = 'memory'
+    except ValueError as error:
+        result['status'] = 'invalid'
+        result['error'] = str(error)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    result['runtime'] = round(time.perf_counter() - start_time, 6)
+    result.update(stats)
+    return result
+
+
+# Solves every instance in a pool of processes and writes the results as JSON lines in the order they finish
+def run_batch(instances, output, workers=None, time_limit=None, memory_limit=None, algorithm='a_star',
+              tie_break='fifo', plan=False, heuristic=None, solutions=None):
+    options = {'time_limit': time_limit, 'memory_limit': memory_limit, 'algorithm': algorithm,
+               'tie_break': tie_break, 'plan': plan, 'heuristic': heuristic, 'solutions': solutions}
+    if solutions:
+        os.makedirs(solutions, exist_ok=True)
+    tasks = [(instance, options) for instance in instances]
+    # A new process for every instance, so the limits and the memory of one instance do not leak to the next one
+    with multiprocessing.Pool(workers, maxtasksperchild=1) as pool:
+        for result in pool.imap_unordered(solve_instance, tasks):
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Solve every liquid puzzle instance of the given files")
+    parser.add_argument('files', nargs='*', default=[INSTANCES_FILE],
+                        help="files in the instances.py format or binary puzzle files (default: instances.py)")
+    parser.add_argument('--instances', type=int, nargs='+', help="only solve these instance numbers")
+    parser.add_argument('--workers', type=int, default=None, help="amount of processes (default: all the cores)")
+    parser.add_argument('--time-limit', type=float, default=None, help="seconds per instance")
+    parser.add_argument('--memory-limit', type=int, default=None, help="megabytes per instance")
+    parser.add_argument('--algorithm', choices=sorted(ALGORITHMS), default='a_star')
+    parser.add_argument('--tie-break', choices=sorted(TIE_BREAKERS), default='fifo')
+    parser.add_argument('--heuristic', default=None,
+                        help="registered heuristic or weighted combination like "
+                             "'custom_heuristic + 0.5*heuristic_second'")
+    parser.add_argument('--plan', action='store_true', help="add the moves (from, to, amount) to every result")
+    parser.add_argument('--solutions', default=None,
+                        help="directory the moves of every solution are written to as binary solution files")
+    parser.add_argument('--output', default=None, help="JSON lines file (default: standard output)")
+    args = parser.parse_args(arguments)
+    if args.heuristic is not None:
+        try:
+            get_heuristic(args.heuristic)
+        except ValueError as error:
+            parser.error(str(error))
+
+    instances = []
+    for path in args.files:
+        instances.extend(read_instances(path))
+    if args.instances is not None:
+        instances = [instance for instance in instances if instance['id'] in args.instances]
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        run_batch(instances, output, args.workers, args.time_limit, args.memory_limit, args.algorithm,
+                  args.tie_break, args.plan, args.heuristic, args.solutions)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import signal
+import sys
+import time
+
+from batch import INSTANCES_FILE, TimeLimitExceeded, on_alarm, read_instances
+from main import HEURISTICS, PackedPuzzle, a_star, generate_puzzle, heuristic_names, ida_star
+from parallel_search import parallel_a_star
+from puzzle_io import read_puzzle
+
+# Reproducible benchmark of the search algorithms, runs a_star and ida_star with every heuristic over the instances of
+# instances.py and over puzzles generated from fixed seeds. Every run is done in a new process so its peak memory can
+# be measured, the results are written to a JSON file and can be compared to a stored baseline:
+#   python benchmark.py --instances 0 1 2 3 --output results.json --baseline baseline.json
+# With --parallel every puzzle is also solved by parallel_a_star with the given amounts of workers, the results get the
+# speedup over a_star with the same heuristic:
+#   python benchmark.py --instances 7 10 15 --algorithms a_star --heuristics custom_heuristic --parallel 2 4
+
+ALGORITHMS = {
+    'a_star': a_star,
+    'ida_star': ida_star,
+}
+
+# The heuristics run by default, any registered heuristic (see main.HEURISTICS) can be chosen
+DEFAULT_HEURISTICS = list(HEURISTICS)
+
+# The generated puzzles, (tubes, tube size, colors, reverse moves), every one is built with the seeds 0..seeds-1
+GENERATED = [
+    (5, 4, 3, 40),
+    (7, 5, 5, 100),
+    (10, 8, 8, 300),
+]
+
+# A run is a regression when it got slower (or expanded more states) by more than this fraction of the baseline
+TOLERANCE = 0.25
+# Runs faster than this (in seconds) are too noisy to compare their time
+MIN_TIME = 0.05
+
+
+# The puzzles of the benchmark as (name, PackedPuzzle). The generated puzzles are packed as they are and not written out
+# as a string, a string would give the puzzle the size of its fullest tube as tube size
+def benchmark_puzzles(instances=None, seeds=3, files=(INSTANCES_FILE,)):
+    puzzles = []
+    for path in files:
+        for instance in read_instances(path):
+            if instances is None or instance['id'] in instances:
+                puzzle = instance['puzzle'] if 'puzzle' in instance else read_puzzle(instance['init'])
+                puzzles.append(("instance-{}".format(instance['id']), puzzle))
+    for tubes_amount, tube_size, colors, moves in GENERATED:
+        for seed in range(seeds):
+            puzzle = generate_puzzle(tubes_amount, tube_size, colors, moves, seed)
+            puzzles.append(("generated-{}x{}x{}-{}".format(tubes_amount, tube_size, colors, seed),
+                            PackedPuzzle.pack(puzzle)))
+    return puzzles
+
+
+# Solves a puzzle with a search function in this process, returns (result, wall time)
+def timed_run(search, puzzle, result, time_limit, **options):
+    if time_limit:
+        signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, time_limit)
+    stats = {}
+    start_time = time.perf_counter()
+    try:
+        path = search(puzzle, stats=stats, **options)
+        result['status'] = 'solved' if path else 'unsolvable'
+        result['length'] = len(path) if path else None
+    except TimeLimitExceeded:
+        result['status'] = 'timeout'
+        result['length'] = None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    wall_time = time.perf_counter() - start_time
+    result['time'] = round(wall_time, 6)
+    result['expanded'] = stats.get('expanded')
+    result['generated'] = stats.get('generated')
+    return result, wall_time
+
+
+# A single run inside its own process
+def run(task):
+    name, puzzle, algorithm, heuristic, time_limit = task
+    result = {'puzzle': name, 'algorithm': algorithm, 'heuristic': heuristic}
+    result, wall_time = timed_run(ALGORITHMS[algorithm], puzzle, result, time_limit, heuristic=heuristic)
+    result['nodes_per_second'] = round(result['expanded'] / wall_time, 1) if result['expanded'] else None
+    # kilobytes on Linux
+    result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+# The speedup of parallel_a_star over a_star. Every puzzle is solved with a_star and then with parallel_a_star for
+# every amount of workers, in this process since the workers of parallel_a_star are processes of their own (the pool of
+# run_benchmark can not start them). The speedup is the time of a_star divided by the time of parallel_a_star
+def run_parallel(puzzles, worker_counts, heuristics=tuple(DEFAULT_HEURISTICS), time_limit=30, progress=None):
+    results = []
+    for name, puzzle in puzzles:
+        for heuristic in heuristics:
+            serial, serial_time = timed_run(a_star, puzzle, {}, time_limit, heuristic=heuristic)
+            for workers in worker_counts:
+                result = {'puzzle': name, 'algorithm': 'parallel_a_star', 'heuristic': heuristic, 'workers': workers}
+                result, wall_time = timed_run(parallel_a_star, puzzle, result, time_limit, workers=workers,
+                                              heuristic=heuristic)
+                result['serial_time'] = serial['time']
+                result['serial_expanded'] = serial['expanded']
+                result['serial_length'] = serial['length']
+                solved = serial['status'] == 'solved' and result['status'] == 'solved'
+                result['speedup'] = round(serial_time / wall_time, 3) if solved else None
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+    return results
+
+
+def run_benchmark(puzzles, algorithms=tuple(ALGORITHMS), heuristics=tuple(DEFAULT_HEURISTICS), time_limit=30, workers=1,
+                  progress=None):
+    tasks = [(name, puzzle, algorithm, heuristic, time_limit)
+             for name, puzzle in puzzles for algorithm in algorithms for heuristic in heuristics]
+    results = []
+    # One run at a time by default so the runs do not compete for the cores
+    with multiprocessing.Pool(workers, maxtasksperchild=1) as pool:
+        for result in pool.imap(run, tasks):
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time_limit': time_limit,
+        'results': results,
+    }
+
+
+def result_key(result):
+    return result['puzzle'], result['algorithm'], result['heuristic']
+
+
+# Compares the results to a baseline, returns a list of the regressions found (as text)
+def compare(results, baseline, tolerance=TOLERANCE):
+    regressions = []
+    old_results = {result_key(result): result for result in baseline['results']}
+    for result in results['results']:
+        old = old_results.get(result_key(result))
+        if old is None:
+            continue
+        name = "/".join(result_key(result))
+        if old['status'] == 'solved' and result['status'] != 'solved':
+            regressions.append("{}: {} (was solved)".format(name, result['status']))
+            continue
+        if result['status'] != 'solved':
+            continue
+        if old['length'] is not None and result['length'] > old['length']:
+            regressions.append("{}: solution length {} (was {})".format(name, result['length'], old['length']))
+        if old['expanded'] and result['expanded'] > old['expanded'] * (1 + tolerance):
+            regressions.append("{}: expanded {} (was {})".format(name, result['expanded'], old['expanded']))
+        if max(result['time'], old['time']) >= MIN_TIME and result['time'] > old['time'] * (1 + tolerance):
+            regressions.append("{}: time {:.3f}s (was {:.3f}s)".format(name, result['time'], old['time']))
+    return regressions
+
+
+def print_result(result):
+    print("{puzzle:<28} {algorithm:<9} {heuristic:<17} {status:<10} length={length} time={time:.3f}s "
+          "expanded={expanded} nodes/s={nodes_per_second} rss={peak_rss_kb}kB".format(**result))
+
+
+def print_parallel(result):
+    print("{puzzle:<28} {workers:>2} workers {heuristic:<17} {status:<10} length={length} (a_star {serial_length}) "
+          "time={time:.3f}s (a_star {serial_time:.3f}s) expanded={expanded} (a_star {serial_expanded}) "
+          "speedup={speedup}".format(**result))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmark the search algorithms and heuristics")
+    parser.add_argument('--instances', type=int, nargs='*', default=None,
+                        help="instance numbers of instances.py to run (default: all)")
+    parser.add_argument('--seeds', type=int, default=3, help="generated puzzles of every size")
+    parser.add_argument('--algorithms', nargs='+', choices=sorted(ALGORITHMS), default=sorted(ALGORITHMS))
+    parser.add_argument('--heuristics', nargs='+', choices=heuristic_names(), default=DEFAULT_HEURISTICS)
+    parser.add_argument('--time-limit', type=float, default=30, help="seconds per run")
+    parser.add_argument('--workers', type=int, default=1, help="runs done at the same time")
+    parser.add_argument('--output', default="benchmark_results.json", help="the results file")
+    parser.add_argument('--baseline', default=None, help="results file to compare to")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--parallel', type=int, nargs='+', default=None, metavar='WORKERS',
+                        help="also run parallel_a_star with these amounts of workers and compare it to a_star")
+    args = parser.parse_args(arguments)
+
+    puzzles = benchmark_puzzles(args.instances, args.seeds)
+    results = run_benchmark(puzzles, args.algorithms, args.heuristics, args.time_limit, args.workers, print_result)
+    if args.parallel:
+        results['parallel'] = run_parallel(puzzles, args.parallel, args.heuristics, args.time_limit, print_parallel)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        print("-" * 30)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        print("{} regressions".format(len(regressions)))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+import argparse
+import heapq
+import json
+import mmap
+import os
+import sys
+import time
+
+from main import PackedPuzzle, Plan, align_path
+from puzzle_io import PuzzleError, read_puzzle
+
+# External memory breadth first search, for puzzles whose states do not fit in memory.
+# Every BFS layer is a file of fixed width records sorted in byte order, a record is a state in its canonical form
+# (every tube padded to the tube size with PAD, the padded tubes sorted). A new layer is built in two passes:
+#  - the layer before it is read through mmap and its states are expanded, the neighbors are kept in a buffer that is
+#    sorted, deduplicated and written to a run file every time it gets full
+#  - the run files are merged into the new layer, and the duplicates are removed only then (delayed duplicate
+#    detection) by merging with all the older layers, a pour can not always be taken back so any older layer may
+#    hold a neighbor again
+# The files are written under a temporary name and renamed once complete, and search.json records the last complete
+# layer, so a search that was stopped continues from its last layer when it is started again with the same directory:
+#   python external_search.py "[[1,2,1],[2,1,2],[]]" --directory /tmp/search
+
+PAD = 0xFF
+# The states kept in memory while building a layer
+BUFFER_STATES = 1 << 20
+META_FILE = "search.json"
+
+
+# The record of a state, its canonical form as fixed width bytes
+def encode(state):
+    tube_size = state.tube_size
+    pad = bytes([PAD])
+    return b''.join(sorted(bytes(tube) + pad * (tube_size - len(tube)) for tube in state.tubes))
+
+
+def decode(record, tubes_amount, tube_size, colors):
+    return PackedPuzzle(tuple(bytes(record[index * tube_size:(index + 1) * tube_size]).rstrip(bytes([PAD]))
+                              for index in range(tubes_amount)), colors, tube_size)
+
+
+# A layer file opened with mmap, its records are read without loading the file
+class LayerFile:
+    def __init__(self, path, record_size):
+        self.path = path
+        self.record_size = record_size
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.length = size // record_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        record_size = self.record_size
+        for offset in range(0, self.length * record_size, record_size):
+            yield self.map[offset:offset + record_size]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+# Writes sorted records to a file under a temporary name, renames it to path once it is complete
+def write_records(path, records):
+    count = 0
+    with open(path + ".tmp", 'wb') as file:
+        for record in records:
+            file.write(record)
+            count += 1
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+    return count
+
+
+# Removes the repeated records of a sorted stream
+def unique(records):
+    previous = None
+    for record in records:
+        if record != previous:
+            yield record
+            previous = record
+
+
+# The records of a sorted stream that are not in any of the sorted layers
+def subtract(records, layers):
+    iterators = [iter(layer) for layer in layers]
+    heads = [next(iterator, None) for iterator in iterators]
+    for record in records:
+        duplicate = False
+        for index, iterator in enumerate(iterators):
+            head = heads[index]
+            while head is not None and head < record:
+                head = next(iterator, None)
+            heads[index] = head
+            if head == record:
+                duplicate = True
+        if not duplicate:
+            yield record
+
+
+class ExternalSearch:
+    def __init__(self, initial_state, directory, buffer_states=BUFFER_STATES):
+        if any(color >= PAD for tube in initial_state.tubes for color in tube):
+            raise ValueError(f"External search supports colors up to {PAD - 1}")
+        self.initial_state = initial_state
+        self.directory = directory
+        self.buffer_states = buffer_states
+        self.tubes_amount = len(initial_state.tubes)
+        self.tube_size = initial_state.tube_size
+        self.colors = initial_state.colors
+        self.record_size = self.tubes_amount * self.tube_size
+        self.puzzle = str([list(tube) for tube in initial_state.tubes])
+        os.makedirs(directory, exist_ok=True)
+
+    def layer_path(self, depth):
+        return os.path.join(self.directory, f"layer-{depth}.bin")
+
+    def run_path(self, depth, index):
+        return os.path.join(self.directory, f"run-{depth}-{index}.bin")
+
+    def decode(self, record):
+        return decode(record, self.tubes_amount, self.tube_size, self.colors)
+
+    # The last complete layer of an earlier search of the same puzzle in the directory, or -1
+    def load_meta(self):
+        path = os.path.join(self.directory, META_FILE)
+        if not os.path.exists(path):
+            return -1
+        with open(path) as file:
+            meta = json.load(file)
+        if meta['puzzle'] != self.puzzle:
+            raise ValueError(f"{self.directory} holds the search of another puzzle")
+        return meta['depth']
+
+    def save_meta(self, depth, goal_depth=None):
+        path = os.path.join(self.directory, META_FILE)
+        with open(path + ".tmp", 'w') as file:
+            json.dump({'puzzle': self.puzzle, 'depth': depth, 'goal_depth': goal_depth}, file)
+        os.replace(path + ".tmp", path)
+
+    # Expands the layer at depth into sorted run files, returns their paths
+    def expand(self, depth, stats):
+        runs = []
+        buffer = set()
+        layer = LayerFile(self.layer_path(depth), self.record_size)
+        try:
+            for record in layer:
+                state = self.decode(record)
+                stats['expanded'] += 1
+                for tube_from, tube_to, amount in state.get_moves():
+                    buffer.add(encode(state.pour(tube_from, tube_to, amount)))
+                    stats['generated'] += 1
+                if len(buffer) >= self.buffer_states:
+                    runs.append(self.run_path(depth + 1, len(runs)))
+                    write_records(runs[-1], sorted(buffer))
+                    buffer.clear()
+        finally:
+            layer.close()
+        if buffer or not runs:
+            runs.append(self.run_path(depth + 1, len(runs)))
+            write_records(runs[-1], sorted(buffer))
+        return runs
+
+    # Merges the runs into the layer at depth, without the states of the older layers
+    def merge(self, depth, runs):
+        run_files = [LayerFile(path, self.record_size) for path in runs]
+        old_layers = [LayerFile(self.layer_path(old), self.record_size) for old in range(depth)]
+        try:
+            merged = unique(heapq.merge(*[iter(run) for run in run_files]))
+            count = write_records(self.layer_path(depth), subtract(merged, old_layers))
+        finally:
+            for layer in run_files + old_layers:
+                layer.close()
+        for path in runs:
+            os.remove(path)
+        return count
+
+    # The first goal in the layer at depth
+    def find_goal(self, depth):
+        layer = LayerFile(self.layer_path(depth), self.record_size)
+        try:
+            for record in layer:
+                state = self.decode(record)
+                if state.is_goal():
+                    return state
+        finally:
+            layer.close()
+        return None
+
+    # Walks back from the goal, the parent of a state is any state of the layer before it with that state as a
+    # neighbor, found by scanning the layer
+    def backtrack(self, goal, depth):
+        path = [goal]
+        for parent_depth in range(depth - 1, -1, -1):
+            target = encode(path[-1])
+            layer = LayerFile(self.layer_path(parent_depth), self.record_size)
+            try:
+                for record in layer:
+                    state = self.decode(record)
+                    if any(encode(state.pour(tube_from, tube_to, amount)) == target
+                           for tube_from, tube_to, amount in state.get_moves()):
+                        path.append(state)
+                        break
+                else:
+                    raise ValueError(f"Layer {parent_depth} has no parent of a state of layer {parent_depth + 1}")
+            finally:
+                layer.close()
+        path[-1] = self.initial_state
+        return Plan.from_states(align_path(path[::-1]))
+
+    def run(self, max_depth=None, stats=None):
+        if stats is None:
+            stats = {}
+        stats.update(expanded=0, generated=0, layers=[])
+        depth = self.load_meta()
+        if depth < 0:
+            write_records(self.layer_path(0), [encode(self.initial_state)])
+            depth = 0
+            self.save_meta(depth)
+        # Runs of a layer that was not complete when the search stopped
+        for name in os.listdir(self.directory):
+            if name.startswith("run-") or name.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, name))
+
+        while True:
+            goal = self.find_goal(depth)
+            if goal is not None:
+                self.save_meta(depth, depth)
+                return self.backtrack(goal, depth)
+            if max_depth is not None and depth >= max_depth:
+                return None
+            runs = self.expand(depth, stats)
+            size = self.merge(depth + 1, runs)
+            stats['layers'].append(size)
+            depth += 1
+            self.save_meta(depth)
+            if size == 0:
+                return None
+
+
+# Breadth first search with the layers on disk, returns the Plan of a shortest path to a goal or None. directory holds
+# the layer files, a search that was stopped is continued from its last complete layer. stats, when given, is a dict
+# that gets the amount of expanded and generated states of this run and the size of every new layer
+def external_bfs(initial_state, directory, buffer_states=BUFFER_STATES, max_depth=None, stats=None):
+    return ExternalSearch(initial_state, directory, buffer_states).run(max_depth, stats)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Breadth first search with the layers on disk")
+    parser.add_argument('puzzle', help="the puzzle, for example \"[[1,2,1],[2,1,2],[]]\", a file holding it or - for "
+                                       "stdin")
+    parser.add_argument('--directory', required=True, help="where the layers are kept, reused to resume a search")
+    parser.add_argument('--buffer', type=int, default=BUFFER_STATES, help="states kept in memory per run file")
+    parser.add_argument('--max-depth', type=int, default=None)
+    args = parser.parse_args(arguments)
+
+    try:
+        puzzle = read_puzzle(args.puzzle, strict=True)
+    except PuzzleError as error:
+        parser.error(str(error))
+    stats = {}
+    start_time = time.perf_counter()
+    path = external_bfs(puzzle, args.directory, args.buffer, args.max_depth, stats)
+    print(f"Runtime: {time.perf_counter() - start_time:.5f} seconds")
+    print(f"Expanded: {stats['expanded']} Layers: {stats['layers']}")
+    if path is None:
+        print("No solution found.")
+        return 1
+    print("Number of Moves: {}".format(len(path)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,19 @@
-from queue import PriorityQueue
-import ast
+import array
+import importlib
+import json
+import os
+import struct
 import time
 import random
+import sys
 
-# this function exists to construct a puzzle given a string
+from puzzle_io import PuzzleError, parse_tubes
+
+# this function exists to construct a puzzle given a string, see puzzle_io for the format and the checks. Every color
+# has to fill whole tubes
 def construct_puzzle(string):
-    try:
-        puzzle = ast.literal_eval(string)
-    except Exception as e:
-        return []
-    return puzzle
+    tubes = parse_tubes(string, strict=True)[0]
+    return [list(tube) for tube in tubes]
 
 
 # UI, An auxiliary function
@@ -17,19 +21,111 @@ def digits(value):
     return len(str(value))
 
 
+# The length of the streak of the same color at the top of a tube
+def top_streak(tube):
+    if not tube:
+        return 0
+    if isinstance(tube, bytes):
+        return len(tube) - len(tube.lstrip(tube[:1]))
+    top = tube[0]
+    streak = 1
+    while streak < len(tube) and tube[streak] == top:
+        streak += 1
+    return streak
+
+
+# Generates every possible move as (tube_from, tube_to, amount), a move pours the whole top streak of a tube on a tube
+# with the same top color or on the first empty tube, and only when the whole streak fits.
+# Moves that give the same puzzle up to the order of the tubes are generated once: pouring a tube of a single color
+# into an empty tube only swaps two tubes, and pouring from (or into) a tube identical to one already used is the same
+# move on another tube number
+def pour_moves(tubes, streaks, tube_size):
+    by_top = {}
+    first_empty = None
+    for index, tube in enumerate(tubes):
+        if tube:
+            if tube[0] in by_top:
+                by_top[tube[0]].append(index)
+            else:
+                by_top[tube[0]] = [index]
+        elif first_empty is None:
+            first_empty = index
+
+    used_sources = set()
+    for tube_from, tube in enumerate(tubes):
+        if not tube:
+            continue
+        source = tuple(tube) if isinstance(tube, list) else tube
+        if source in used_sources:
+            continue
+        used_sources.add(source)
+        amount = streaks[tube_from]
+        used_targets = set()
+        for tube_to in by_top[tube[0]]:
+            if tube_to == tube_from or len(tubes[tube_to]) + amount > tube_size:
+                continue
+            target = tuple(tubes[tube_to]) if isinstance(tube, list) else tubes[tube_to]
+            if target in used_targets:
+                continue
+            used_targets.add(target)
+            yield tube_from, tube_to, amount
+        if first_empty is not None and amount != len(tube):
+            yield tube_from, first_empty, amount
+
+
+# Generates every pour that leads to the given tubes as (tube_from, tube_to, amount), the exact reverse of pour_moves:
+# the top amount units of tube_to were poured from tube_from, so before the pour they were the whole top streak of
+# tube_from (its next unit is another color) and tube_to was empty or had the same color at the top. A whole tube is
+# never poured into an empty tube, and like in pour_moves the pours from and to identical tubes are generated once
+def reverse_pour_moves(tubes, streaks, tube_size):
+    used_targets = set()
+    for tube_to, tube in enumerate(tubes):
+        if not tube:
+            continue
+        target = tuple(tube) if isinstance(tube, list) else tube
+        if target in used_targets:
+            continue
+        used_targets.add(target)
+        color = tube[0]
+        streak = streaks[tube_to]
+        for amount in range(1, streak + 1):
+            # Under the poured units there is nothing or the same color
+            if amount == streak and amount != len(tube):
+                continue
+            used_sources = set()
+            for tube_from, source in enumerate(tubes):
+                if tube_from == tube_to or len(source) + amount > tube_size or (source and source[0] == color):
+                    continue
+                if not source and amount == len(tube):
+                    continue
+                source = tuple(source) if isinstance(source, list) else source
+                if source in used_sources:
+                    continue
+                used_sources.add(source)
+                yield tube_from, tube_to, amount
+
+
 # This class represent the liquid puzzle
 class LiquidPuzzle:
-    def __init__(self, string, Moved=False, newTubes=[], colors=0, tube_size=0):
-        if Moved:
-            self.tubes = newTubes
-            self.colors = colors
-            self.tube_size = tube_size
-        else:
-            self.colors = 0
-            self.tubes = construct_puzzle(string)
-            if not self.construct_correctness():
-                raise ValueError("Invalid puzzle configuration")
-            self.tube_size = max(len(tube) for tube in self.tubes)
+    # Builds a puzzle from the input of a user, the string (or a file, see puzzle_io) is parsed and the amount of every
+    # color checked in a single pass (every color has to fill whole tubes), an invalid puzzle raises a PuzzleError (a
+    # ValueError) that names the tube or color
+    def __init__(self, string):
+        tubes, amounts = parse_tubes(string, strict=True)
+        if not tubes:
+            raise PuzzleError("The puzzle has no tubes")
+        self.tubes = [list(tube) for tube in tubes]
+        self.colors = len(amounts)
+        self.tube_size = max(len(tube) for tube in self.tubes)
+
+    # Builds a puzzle derived from a valid one (a move or a copy), the tubes are trusted so nothing is parsed or checked
+    @staticmethod
+    def from_tubes(tubes, colors, tube_size):
+        puzzle = LiquidPuzzle.__new__(LiquidPuzzle)
+        puzzle.tubes = tubes
+        puzzle.colors = colors
+        puzzle.tube_size = tube_size
+        return puzzle
 
     # Checks if the move is valid only work in the correct direction no reverse action
     def is_valid_move(self, tube_from, tube_to, reverse=False):
@@ -45,74 +141,28 @@ class LiquidPuzzle:
                 return True
         return False
 
-    # Checks if the given puzzle is even a correct input
-    def construct_correctness(self):
-        color_count = {}
-        max_tube = max(len(tube) for tube in self.tubes) if self.tubes else 0
-
-        # Count occurrences of each color
-        for tube in self.tubes:
-            for color in tube:
-                if color in color_count:
-                    color_count[color] += 1
-                else:
-                    color_count[color] = 1
-
-        # Check if each color has the correct amount in the puzzle
-        for color, count in color_count.items():
-            if count > max_tube * len(self.tubes):
-                return False
-        self.colors = len(color_count)
-        return True
-
     # Makes a move if the move is valid else return None, but if it is correct is builds a new liquid puzzle
     def move(self, tube_from, tube_to, reverse=False):
         if self.is_valid_move(tube_from, tube_to, reverse):
             new_tubes = [list(tube) for tube in self.tubes]
             new_tubes[tube_to].insert(0, new_tubes[tube_from].pop(0))
-            return LiquidPuzzle("",True,new_tubes,self.colors,self.tube_size)
+            return LiquidPuzzle.from_tubes(new_tubes, self.colors, self.tube_size)
         return None
 
+    # Pours the top amount units of tube_from on tube_to in a single step and builds a new liquid puzzle
+    def pour(self, tube_from, tube_to, amount):
+        new_tubes = [list(tube) for tube in self.tubes]
+        new_tubes[tube_to][0:0] = new_tubes[tube_from][:amount]
+        del new_tubes[tube_from][:amount]
+        return LiquidPuzzle.from_tubes(new_tubes, self.colors, self.tube_size)
+
+    # Generates the possible moves as (tube_from, tube_to, amount) without building the new puzzles
+    def get_moves(self):
+        return pour_moves(self.tubes, [top_streak(tube) for tube in self.tubes], self.tube_size)
+
     # Finds all the possible moves for the current liquid puzzle
     def get_neighbors(self):
-        top_color = {}
-        # top color same counter
-        count = 0
-        for tube in self.tubes:
-            if not tube:
-                top_color[count] = 0
-            else:
-                top = tube[0]
-                streak = 1
-                for i in range(1, len(tube)):
-                    if tube[i] != top:
-                        break
-                    streak += 1
-
-                top_color[count] = streak
-            count += 1
-
-        neighbors = []
-        possible_tubes = []
-        empty_tube = False
-        for i in range(len(self.tubes)):
-            if not self.tubes[i] and not empty_tube:
-                empty_tube = True
-                possible_tubes.append(i)
-            elif self.tubes[i]:
-                possible_tubes.append(i)
-
-        for i in possible_tubes:
-            for j in possible_tubes:
-                neighbor = self.move(i, j)
-                for k in range(1, top_color[i] + 1):
-                    if not neighbor:
-                        break
-                    if neighbor and i != j and k == top_color[i] and not self.new_eq(neighbor):
-                        neighbors.append(neighbor)
-                    neighbor = neighbor.move(i, j)
-
-        return neighbors
+        return [self.pour(tube_from, tube_to, amount) for tube_from, tube_to, amount in self.get_moves()]
 
     # UI, Building a final result using the values given by the, returns Boolean
     def buildComplete(self, tNum, tSize, colorNum):
@@ -149,10 +199,11 @@ class LiquidPuzzle:
         return puzzle
 
     @staticmethod
-    # an Auxiliary method for get_neighbors that helps construct a new puzzle
+    # an Auxiliary method for get_neighbors that helps construct a new puzzle from a list of tubes
     def from_puzzle(puzzle):
-        puzzle_str = '[' + '],['.join([','.join(map(str, tube)) if tube else '' for tube in puzzle]) + ']'
-        return LiquidPuzzle(puzzle_str)
+        colors = len({color for tube in puzzle for color in tube})
+        tube_size = max((len(tube) for tube in puzzle), default=0)
+        return LiquidPuzzle.from_tubes([list(tube) for tube in puzzle], colors, tube_size)
 
     # an Auxiliary method created for A-star to check if we solved the liquid puzzle
     def is_goal(self):
@@ -176,7 +227,7 @@ class LiquidPuzzle:
         return hash(tuple(tuple(tube) for tube in self.tubes))
 
     def __lt__(self, other):
-        return str(self.tubes) < str(other.tubes)
+        return self.tubes < other.tubes
 
     def __str__(self):
         return '[' + ']['.join([','.join(map(str, tube)) if tube else '[]' for tube in self.tubes]) + ']'
@@ -205,6 +256,151 @@ class LiquidPuzzle:
         print(result + "\n" + row)
 
 
+# This class is the compact, immutable version of the liquid puzzle used by the search algorithms.
+# Every tube is packed into a bytes object (top of the tube at index 0, like LiquidPuzzle), when the colors do not
+# fit in a byte a tuple is used instead. A move only rebuilds the two tubes it touches, all the other tubes are shared
+# with the parent state, and the hash is calculated once when the state is built.
+# The order of the tubes does not matter for solving the puzzle, so two states are equal when they hold the same tubes
+# in any order, the hash and the equality use the canonical form (the sorted tubes) while the tubes themselves keep
+# their original order so the moves of a path always refer to the real tube numbers.
+class PackedPuzzle:
+    __slots__ = ('tubes', 'colors', 'tube_size', 'streaks', 'key', '_hash')
+
+    def __init__(self, tubes, colors, tube_size, streaks=None):
+        if streaks is None:
+            streaks = tuple(top_streak(tube) for tube in tubes)
+        object.__setattr__(self, 'tubes', tubes)
+        object.__setattr__(self, 'colors', colors)
+        object.__setattr__(self, 'tube_size', tube_size)
+        object.__setattr__(self, 'streaks', streaks)
+        key = tuple(sorted(tubes))
+        object.__setattr__(self, 'key', key)
+        object.__setattr__(self, '_hash', hash(key))
+
+    # Packs a list of tubes (lists of colors), the top of every tube is at index 0
+    @staticmethod
+    def from_tubes(tubes, colors=None, tube_size=None):
+        if colors is None:
+            colors = len({color for tube in tubes for color in tube})
+        if tube_size is None:
+            tube_size = max((len(tube) for tube in tubes), default=0)
+        if all(0 <= color < 256 for tube in tubes for color in tube):
+            packed = tuple(bytes(tube) for tube in tubes)
+        else:
+            packed = tuple(tuple(tube) for tube in tubes)
+        return PackedPuzzle(packed, colors, tube_size)
+
+    # Packs an existing LiquidPuzzle
+    @staticmethod
+    def pack(puzzle):
+        return PackedPuzzle.from_tubes(puzzle.tubes, puzzle.colors, puzzle.tube_size)
+
+    # Builds back a regular (mutable) LiquidPuzzle, mainly used by the UI
+    def unpack(self):
+        return LiquidPuzzle.from_tubes([list(tube) for tube in self.tubes], self.colors, self.tube_size)
+
+    # Same rules as LiquidPuzzle.is_valid_move
+    def is_valid_move(self, tube_from, tube_to, reverse=False):
+        tubes = self.tubes
+        if not tubes[tube_from]:
+            return False
+        if len(tubes[tube_to]) >= self.tube_size:
+            return False
+        if not reverse:
+            if not tubes[tube_to] or tubes[tube_from][0] == tubes[tube_to][0]:
+                return True
+        else:
+            if len(tubes[tube_from]) > 1 and tubes[tube_from][0] == tubes[tube_from][1]:
+                return True
+        return False
+
+    # Moves a single unit of liquid, only the two tubes that changed are rebuilt
+    def move(self, tube_from, tube_to, reverse=False):
+        if self.is_valid_move(tube_from, tube_to, reverse):
+            new_tubes = list(self.tubes)
+            source = new_tubes[tube_from]
+            new_tubes[tube_to] = source[:1] + new_tubes[tube_to]
+            new_tubes[tube_from] = source[1:]
+            return PackedPuzzle(tuple(new_tubes), self.colors, self.tube_size)
+        return None
+
+    # Pours the top amount units of tube_from on tube_to, the move is not checked (use get_moves).
+    # Only the two tubes and their top streaks are rebuilt, everything else is shared with this state
+    def pour(self, tube_from, tube_to, amount):
+        new_tubes = list(self.tubes)
+        source = new_tubes[tube_from]
+        target = new_tubes[tube_to]
+        new_tubes[tube_to] = source[:amount] + target
+        new_tubes[tube_from] = source[amount:]
+        streaks = list(self.streaks)
+        streaks[tube_to] += amount
+        streaks[tube_from] = top_streak(new_tubes[tube_from])
+        return PackedPuzzle(tuple(new_tubes), self.colors, self.tube_size, tuple(streaks))
+
+    # Generates the possible moves as (tube_from, tube_to, amount) from the cached top streaks, without building
+    # the new states
+    def get_moves(self):
+        return pour_moves(self.tubes, self.streaks, self.tube_size)
+
+    # Generates the pours that lead to this state as (tube_from, tube_to, amount), see reverse_pour_moves
+    def get_reverse_moves(self):
+        return reverse_pour_moves(self.tubes, self.streaks, self.tube_size)
+
+    # Takes back pour(tube_from, tube_to, amount), the top amount units of tube_to go back on tube_from
+    def unpour(self, tube_from, tube_to, amount):
+        new_tubes = list(self.tubes)
+        source = new_tubes[tube_from]
+        target = new_tubes[tube_to]
+        new_tubes[tube_from] = target[:amount] + source
+        new_tubes[tube_to] = target[amount:]
+        streaks = list(self.streaks)
+        streaks[tube_from] = amount
+        streaks[tube_to] = top_streak(new_tubes[tube_to])
+        return PackedPuzzle(tuple(new_tubes), self.colors, self.tube_size, tuple(streaks))
+
+    # Finds all the possible moves for the current state
+    def get_neighbors(self):
+        return [self.pour(tube_from, tube_to, amount) for tube_from, tube_to, amount in self.get_moves()]
+
+    def is_goal(self):
+        tube_size = self.tube_size
+        for tube in self.tubes:
+            if tube and (len(tube) != tube_size or tube.count(tube[0]) != tube_size):
+                return False
+        return True
+
+    def new_eq(self, other):
+        for tube in self.tubes:
+            if tube not in other.tubes:
+                return False
+        return True
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PackedPuzzle is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("PackedPuzzle is immutable")
+
+    # The default pickling of slots goes through setattr, so the state is rebuilt through the constructor instead
+    def __reduce__(self):
+        return PackedPuzzle, (self.tubes, self.colors, self.tube_size)
+
+    def __eq__(self, other):
+        if isinstance(other, PackedPuzzle):
+            return self._hash == other._hash and self.key == other.key
+        return False
+
+    def __hash__(self):
+        return self._hash
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+    __str__ = LiquidPuzzle.__str__
+
+    special_print = LiquidPuzzle.special_print
+
+
 # The heuristic function
 def heuristic(puzzle):
     return custom_heuristic(puzzle)
@@ -314,48 +510,9 @@ def heuristic_fourth(puzzle):
     Heuristic function for the tube sorting puzzle using Manhattan distance.
     """
     tubes = puzzle.tubes
-    tube_size = puzzle.tube_size
-    color_goal_positions = {}
-    weights = {'empty_weight': 10, 'consolidate_weight': 5, 'overflow_penalty': 2,
-               'top_bonus': 1, 'bottom_bonus': 1, 'sequence_reward': 3}
-
-    # Determine the target positions for each color in the goal state
-    for idx, tube in enumerate(tubes):
-        for pos, color in enumerate(tube):
-            if color not in color_goal_positions:
-                color_goal_positions[color] = []
-            color_goal_positions[color].append((idx, pos))
-
     total_metric = 0
-    for idx, tube in enumerate(tubes):
-        current_streak_color = None
-        streak_length = 0
-        for pos, color in enumerate(tube):
-            if color_goal_positions[color]:
-                goal_idx, goal_pos = color_goal_positions[color].pop(0)  # Get the first target position for this color
-                distance = abs(idx - goal_idx) + abs(pos - goal_pos)  # Calculate a custom distance metric
-                total_metric += distance
-
-                # Apply weights
-                if pos == len(tube) - 1:
-                    total_metric -= weights['top_bonus']
-                if pos == 0:
-                    total_metric -= weights['bottom_bonus']
-                if pos > 0 and tube[pos - 1] == color:
-                    total_metric -= weights['consolidate_weight']
-                if idx != goal_idx:
-                    total_metric += len(color_goal_positions[color]) * weights['overflow_penalty']
-
-                if color == current_streak_color:
-                    streak_length += 1
-                else:
-                    current_streak_color = color
-                    streak_length = 1
-                total_metric -= weights['sequence_reward'] * (streak_length - 1)
-
-    empty_tubes_count = sum(1 for tube in tubes if not tube)
-    total_metric -= empty_tubes_count * weights['empty_weight']
-
+    for tube in tubes:
+        total_metric += fourth_tube_score(tube, puzzle.tube_size)
     return total_metric
 
 
@@ -364,198 +521,1792 @@ def custom_heuristic(current_state):
     Heuristic function for the tube sorting puzzle using custom logic.
     """
     tubes = current_state.tubes
-    tube_size = current_state.tube_size
-    color_goal_positions = {}
-    weights = {'empty_tube_penalty': 10, 'color_consistency_bonus': 5, 'extra_color_penalty': 2,
-               'top_color_bonus': 1, 'bottom_color_bonus': 1, 'sequence_bonus': 3}
-
-    # Determine the target positions for each color in the goal state
-    for idx, tube in enumerate(tubes):
-        for pos, color in enumerate(tube):
-            if color not in color_goal_positions:
-                color_goal_positions[color] = []
-            color_goal_positions[color].append((idx, pos))
-
     total_heuristic = 0
-    for idx, tube in enumerate(tubes):
-        current_streak_color = None
-        streak_length = 0
-        for pos, color in enumerate(tube):
-            if color_goal_positions[color]:
-                goal_idx, goal_pos = color_goal_positions[color].pop(0)  # Get the first target position for this color
-
-                # Apply penalties and bonuses based on positions
-                if pos == len(tube) - 1:
-                    total_heuristic -= weights['top_color_bonus']
-                if pos == 0:
-                    total_heuristic -= weights['bottom_color_bonus']
-                if pos > 0 and tube[pos - 1] == color:
-                    total_heuristic -= weights['color_consistency_bonus']
-                if idx != goal_idx:
-                    total_heuristic += len(color_goal_positions[color]) * weights['extra_color_penalty']
-
-                # Check for color sequences and apply bonuses
-                if color == current_streak_color:
-                    streak_length += 1
+    for tube in tubes:
+        total_heuristic += custom_tube_score(tube, current_state.tube_size)
+    return total_heuristic
+
+
+# The part of a single tube in heuristic_fourth and custom_heuristic, a bonus for the top and bottom cells and a bonus
+# for every cell that continues a streak of its color.
+# Both heuristics used to give every cell a goal position by scanning the tubes in order and popping the positions back
+# in the same order, so every cell got its own position back - the distance and the extra color penalty were always 0
+def streak_tube_score(tube, top_bonus, bottom_bonus, consistency_bonus, sequence_bonus):
+    if not tube:
+        return 0
+    score = -top_bonus - bottom_bonus
+    previous = None
+    streak = 0
+    for color in tube:
+        if color == previous:
+            streak += 1
+            score -= consistency_bonus + sequence_bonus * streak
+        else:
+            previous = color
+            streak = 0
+    return score
+
+
+def fourth_tube_score(tube, tube_size):
+    weights = {'empty_weight': 10, 'consolidate_weight': 5, 'top_bonus': 1, 'bottom_bonus': 1, 'sequence_reward': 3}
+    if not tube:
+        return -weights['empty_weight']
+    return streak_tube_score(tube, weights['top_bonus'], weights['bottom_bonus'], weights['consolidate_weight'],
+                             weights['sequence_reward'])
+
+
+def custom_tube_score(tube, tube_size):
+    weights = {'empty_tube_penalty': 10, 'color_consistency_bonus': 5, 'top_color_bonus': 1,
+               'bottom_color_bonus': 1, 'sequence_bonus': 3}
+    if not tube:
+        return weights['empty_tube_penalty']
+    return streak_tube_score(tube, weights['top_color_bonus'], weights['bottom_color_bonus'],
+                             weights['color_consistency_bonus'], weights['sequence_bonus'])
+
+
+# The part of a single tube in heuristic_first
+def first_tube_score(tube, tube_size):
+    if not tube:
+        return 0
+    if top_streak(tube) != len(tube):
+        # a mixed tube, it has to be emptied
+        return 1 + len(tube)
+    return tube_size - len(tube)
+
+
+# The amount of times a color sits on a different color in a tube, the first part of heuristic_second
+def color_changes(tube, tube_size=0):
+    changes = 0
+    for i in range(len(tube) - 1):
+        if tube[i] != tube[i + 1]:
+            changes += 1
+    return changes
+
+
+# The top color of a tube and the amount it adds to that color in heuristic_third (rule 1), a solid tube adds nothing
+# unless it holds a single unit
+def third_top_part(tube):
+    streak = top_streak(tube)
+    if streak == len(tube) and streak > 1:
+        return tube[0], 0
+    return tube[0], streak
+
+
+# The part of a single tube in rule 2 of heuristic_third
+def third_bottom_score(tube, tube_size):
+    if not tube:
+        return tube_size
+    bottom = tube[-1]
+    streak = 1
+    for i in range(len(tube) - 2, -1, -1):
+        if tube[i] != bottom:
+            break
+        streak += 1
+    return tube_size - streak
+
+
+# Incremental heuristics, a pour only changes two tubes so instead of scanning the whole puzzle for every state
+# they keep the data of the parent state and rescore only the source and destination tubes.
+# start(state) returns the data of a state, after_pour(data, state, tube_from, tube_to, old_from, old_to) returns the
+# data of a state reached by a pour (state holds the new tubes, old_from and old_to are the two tubes before the pour)
+# and value(data) returns the heuristic value.
+# A batched heuristic also has after_pours(state, moves, neighbors), the data of all the neighbors of an expansion in a
+# single call (see vector_heuristics.py).
+# This base class is used for heuristics that can not be updated, it simply evaluates the whole state every time
+class IncrementalHeuristic:
+    # The amount of scored tubes every heuristic remembers before starting over
+    cache_limit = 1 << 16
+    batched = False
+
+    def __init__(self, function, name=None):
+        self.function = function
+        self.name = name or function.__name__
+        self.caches = {}
+
+    # The full (non incremental) heuristic
+    def __call__(self, state):
+        return self.function(state)
+
+    def start(self, state):
+        return self.function(state)
+
+    def after_pour(self, data, state, tube_from, tube_to, old_from, old_to):
+        return self.function(state)
+
+    def value(self, data):
+        return data
+
+    # Scores a single tube with the given function, packed tubes are immutable so their scores are remembered
+    def cached(self, function, tube, tube_size):
+        cache = self.caches.get((function, tube_size))
+        if cache is None:
+            cache = self.caches[(function, tube_size)] = {}
+        value = cache.get(tube)
+        if value is None:
+            if len(cache) >= self.cache_limit:
+                cache.clear()
+            value = cache[tube] = function(tube, tube_size)
+        return value
+
+
+# A heuristic that is the sum of the scores of the tubes
+class TubeSumHeuristic(IncrementalHeuristic):
+    def __init__(self, function, tube_score):
+        super().__init__(function)
+        self.tube_score = tube_score
+
+    def start(self, state):
+        return sum(self.cached(self.tube_score, tube, state.tube_size) for tube in state.tubes)
+
+    def after_pour(self, data, state, tube_from, tube_to, old_from, old_to):
+        tube_size = state.tube_size
+        score = self.tube_score
+        return (data - self.cached(score, old_from, tube_size) - self.cached(score, old_to, tube_size)
+                + self.cached(score, state.tubes[tube_from], tube_size)
+                + self.cached(score, state.tubes[tube_to], tube_size))
+
+
+# heuristic_second, the data is (color changes, non empty tubes, {bottom color: amount of tubes})
+class SecondHeuristic(IncrementalHeuristic):
+    def __init__(self):
+        super().__init__(heuristic_second)
+
+    def start(self, state):
+        bottoms = {}
+        for tube in state.tubes:
+            if tube:
+                bottoms[tube[-1]] = bottoms.get(tube[-1], 0) + 1
+        changes = sum(self.cached(color_changes, tube, state.tube_size) for tube in state.tubes)
+        return changes, sum(bottoms.values()), bottoms
+
+    def after_pour(self, data, state, tube_from, tube_to, old_from, old_to):
+        changes, non_empty, bottoms = data
+        new_from = state.tubes[tube_from]
+        new_to = state.tubes[tube_to]
+        tube_size = state.tube_size
+        changes += (self.cached(color_changes, new_from, tube_size) + self.cached(color_changes, new_to, tube_size)
+                    - self.cached(color_changes, old_from, tube_size) - self.cached(color_changes, old_to, tube_size))
+        # The bottoms only change when the source was emptied or the destination was empty
+        if not new_from or not old_to:
+            bottoms = dict(bottoms)
+            if not new_from:
+                non_empty -= 1
+                bottoms[old_from[-1]] -= 1
+                if not bottoms[old_from[-1]]:
+                    del bottoms[old_from[-1]]
+            if not old_to:
+                non_empty += 1
+                bottoms[new_to[-1]] = bottoms.get(new_to[-1], 0) + 1
+        return changes, non_empty, bottoms
+
+    def value(self, data):
+        return data[0] + data[1] - len(data[2])
+
+
+# heuristic_third, the data is (rule 2, rule 1, {top color: (amount of tubes, streak sum)})
+class ThirdHeuristic(IncrementalHeuristic):
+    def __init__(self):
+        super().__init__(heuristic_third)
+
+    def start(self, state):
+        tops = {}
+        for tube in state.tubes:
+            if tube:
+                color, value = third_top_part(tube)
+                count, total = tops.get(color, (0, 0))
+                tops[color] = (count + 1, total + value)
+        rule_one = sum(2 ** total for count, total in tops.values())
+        rule_two = sum(self.cached(third_bottom_score, tube, state.tube_size) for tube in state.tubes)
+        return rule_two, rule_one, tops
+
+    def after_pour(self, data, state, tube_from, tube_to, old_from, old_to):
+        rule_two, rule_one, tops = data
+        new_from = state.tubes[tube_from]
+        new_to = state.tubes[tube_to]
+        tube_size = state.tube_size
+        rule_two += (self.cached(third_bottom_score, new_from, tube_size)
+                     + self.cached(third_bottom_score, new_to, tube_size)
+                     - self.cached(third_bottom_score, old_from, tube_size)
+                     - self.cached(third_bottom_score, old_to, tube_size))
+
+        tops = dict(tops)
+        before = {}
+        for tube, sign in ((old_from, -1), (old_to, -1), (new_from, 1), (new_to, 1)):
+            if tube:
+                color, value = third_top_part(tube)
+                if color not in before:
+                    before[color] = tops.get(color)
+                count, total = tops.get(color, (0, 0))
+                count += sign
+                total += sign * value
+                if count:
+                    tops[color] = (count, total)
                 else:
-                    current_streak_color = color
-                    streak_length = 1
-                total_heuristic -= weights['sequence_bonus'] * (streak_length - 1)
+                    del tops[color]
+        for color, old in before.items():
+            if old is not None:
+                rule_one -= 2 ** old[1]
+            if color in tops:
+                rule_one += 2 ** tops[color][1]
+        return rule_two, rule_one, tops
+
+    def value(self, data):
+        return data[0] + data[1]
+
+
+INCREMENTAL_HEURISTICS = {
+    heuristic_first: TubeSumHeuristic(heuristic_first, first_tube_score),
+    heuristic_second: SecondHeuristic(),
+    heuristic_third: ThirdHeuristic(),
+    heuristic_fourth: TubeSumHeuristic(heuristic_fourth, fourth_tube_score),
+    custom_heuristic: TubeSumHeuristic(custom_heuristic, custom_tube_score),
+}
+INCREMENTAL_HEURISTICS[heuristic] = INCREMENTAL_HEURISTICS[custom_heuristic]
+
+
+# Returns the incremental version of a heuristic, None gives the default heuristic
+def incremental_heuristic(function=None):
+    if function is None:
+        function = heuristic
+    if isinstance(function, IncrementalHeuristic):
+        return function
+    if isinstance(function, str):
+        return get_heuristic(function)
+    if function in INCREMENTAL_HEURISTICS:
+        return INCREMENTAL_HEURISTICS[function]
+    return IncrementalHeuristic(function)
+
+
+# A weighted sum of heuristics, parts is a list of (weight, heuristic), the data keeps the data of every part so the
+# combination is as incremental as its parts
+class WeightedHeuristic(IncrementalHeuristic):
+    def __init__(self, parts):
+        self.parts = [(weight, incremental_heuristic(part)) for weight, part in parts]
+        super().__init__(None, " + ".join(f"{weight}*{part.name}" for weight, part in self.parts))
+
+    def __call__(self, state):
+        return sum(weight * part(state) for weight, part in self.parts)
+
+    def start(self, state):
+        return tuple(part.start(state) for weight, part in self.parts)
+
+    def after_pour(self, data, state, tube_from, tube_to, old_from, old_to):
+        return tuple(part.after_pour(part_data, state, tube_from, tube_to, old_from, old_to)
+                     for (weight, part), part_data in zip(self.parts, data))
+
+    def value(self, data):
+        return sum(weight * part.value(part_data) for (weight, part), part_data in zip(self.parts, data))
+
+
+# Measures a heuristic while it is used by a search, evaluations is the amount of scored states and time the seconds
+# spent scoring them
+class TimedHeuristic(IncrementalHeuristic):
+    def __init__(self, heuristic):
+        self.heuristic = incremental_heuristic(heuristic)
+        super().__init__(self.heuristic.function, self.heuristic.name)
+        self.evaluations = 0
+        self.time = 0.0
+
+    def __call__(self, state):
+        return self.heuristic(state)
+
+    def start(self, state):
+        start_time = time.perf_counter()
+        data = self.heuristic.start(state)
+        self.time += time.perf_counter() - start_time
+        self.evaluations += 1
+        return data
+
+    def after_pour(self, data, state, tube_from, tube_to, old_from, old_to):
+        start_time = time.perf_counter()
+        data = self.heuristic.after_pour(data, state, tube_from, tube_to, old_from, old_to)
+        self.time += time.perf_counter() - start_time
+        self.evaluations += 1
+        return data
+
+    def value(self, data):
+        return self.heuristic.value(data)
+
+    # The average seconds of a single evaluation
+    def cost(self):
+        return self.time / self.evaluations if self.evaluations else 0.0
+
+
+# The heuristic registry, every heuristic by name so it can be chosen per call (solve, a_star, ida_star and the command
+# line tools all take a name)
+HEURISTICS = {
+    'heuristic_first': INCREMENTAL_HEURISTICS[heuristic_first],
+    'heuristic_second': INCREMENTAL_HEURISTICS[heuristic_second],
+    'heuristic_third': INCREMENTAL_HEURISTICS[heuristic_third],
+    'heuristic_fourth': INCREMENTAL_HEURISTICS[heuristic_fourth],
+    'custom_heuristic': INCREMENTAL_HEURISTICS[custom_heuristic],
+}
+# Heuristics of the other modules, name: (module, function), they are imported the first time they are used. The tubes
+# of workplace_1 hold the bottom first, its entry reverses the tubes of the puzzle before scoring it
+EXTERNAL_HEURISTICS = {
+    'workplace_1': ('workplace_1', 'top_first_heuristic'),
+    'workplace_2': ('workplace_2', 'heuristic'),
+    'pattern_database': ('pattern_database', 'heuristic'),
+    'heuristic_first_batch': ('vector_heuristics', 'heuristic_first_batch'),
+    'heuristic_second_batch': ('vector_heuristics', 'heuristic_second_batch'),
+    'heuristic_third_batch': ('vector_heuristics', 'heuristic_third_batch'),
+    'custom_heuristic_batch': ('vector_heuristics', 'custom_heuristic_batch'),
+}
+# Heuristics that are only run when they are asked for by name, pattern_database builds its tables under ~/.cache the
+# first time it scores a puzzle size
+OPT_IN_HEURISTICS = {'pattern_database'}
+# Heuristics that never overestimate the real distance, the bounds of anytime_a_star are only given for these
+ADMISSIBLE_HEURISTICS = {'pattern_database'}
+
+
+# Adds a heuristic (a function of a puzzle or an IncrementalHeuristic) to the registry
+def register_heuristic(name, function):
+    if isinstance(function, IncrementalHeuristic):
+        HEURISTICS[name] = function
+    else:
+        HEURISTICS[name] = IncrementalHeuristic(function, name)
+    return HEURISTICS[name]
 
-    empty_tubes_count = sum(1 for tube in tubes if not tube)
-    total_heuristic += empty_tubes_count * weights['empty_tube_penalty']
 
-    return total_heuristic
+def heuristic_names():
+    return list(HEURISTICS) + [name for name in EXTERNAL_HEURISTICS if name not in HEURISTICS]
 
-# A star algorithm
-def a_star(initial_state):
-    open_set = PriorityQueue()
-    open_set.put((0, initial_state))
-    came_from = {}
-    g_score = {initial_state: 0}
-    f_score = {initial_state: heuristic(initial_state)}
-    closed_set = set()
 
-    count = 0
-    while not open_set.empty():
-        current = open_set.get()[1]
+# The heuristics run when no names are given, every known heuristic but the OPT_IN_HEURISTICS
+def default_heuristic_names():
+    return [name for name in heuristic_names() if name not in OPT_IN_HEURISTICS]
+
+
+# Returns the heuristic registered under a name, a weighted combination of registered heuristics is written as
+# "custom_heuristic + 0.5*heuristic_second"
+def get_heuristic(name):
+    name = name.strip()
+    if name in HEURISTICS:
+        return HEURISTICS[name]
+    if name in EXTERNAL_HEURISTICS:
+        module, function = EXTERNAL_HEURISTICS[name]
+        return register_heuristic(name, getattr(importlib.import_module(module), function))
+    if '+' in name or '*' in name:
+        parts = []
+        for term in name.split('+'):
+            weight, _, part = term.rpartition('*')
+            weight = weight.strip()
+            try:
+                weight = int(weight) if weight.isdigit() else float(weight) if weight else 1
+            except ValueError:
+                raise ValueError(f"Bad weight {weight!r} in heuristic {name}, a weighted combination is written as "
+                                 f"'custom_heuristic + 0.5*heuristic_second'") from None
+            parts.append((weight, get_heuristic(part)))
+        return WeightedHeuristic(parts)
+    raise ValueError(f"Unknown heuristic {name}, the known heuristics are: {', '.join(heuristic_names())}")
+
+
+# The cost of every heuristic (of the default_heuristic_names when no names are given), returns {name: average
+# seconds to score a state} over the given states
+def heuristic_costs(states, names=None):
+    costs = {}
+    for name in names or default_heuristic_names():
+        function = get_heuristic(name)
+        start_time = time.perf_counter()
+        for state in states:
+            function.value(function.start(state))
+        costs[name] = (time.perf_counter() - start_time) / max(len(states), 1)
+    return costs
+
+
+# Runs a search with every heuristic of a portfolio (names or weighted combinations) one after the other and returns
+# the name of the fastest one, its path and {name: (runtime, expanded states, number of moves)} of all of them. The
+# portfolio is the default_heuristic_names when no names are given.
+# See portfolio.py for racing the configurations in parallel
+def heuristic_portfolio(initial_state, names=None, algorithm=None):
+    if algorithm is None:
+        algorithm = a_star
+    results = {}
+    best_name, best_path = None, None
+    for name in names or default_heuristic_names():
+        stats = {}
+        start_time = time.perf_counter()
+        path = algorithm(initial_state, heuristic=name, stats=stats)
+        runtime = time.perf_counter() - start_time
+        results[name] = (runtime, stats['expanded'], len(path) if path else None)
+        if path and (best_name is None or runtime < results[best_name][0]):
+            best_name, best_path = name, path
+    return best_name, best_path, results
+
+
+# The open set of A star, a binary heap that also remembers the position of every state in it.
+# This allows to update the priority of a state that is already in the heap (decrease key) in O(log n)
+# instead of rebuilding the whole queue, the heap only compares priorities and never the states themselves.
+class OpenSet:
+    def __init__(self):
+        self.heap = []
+        self.position = {}
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, item):
+        return item in self.position
+
+    def __iter__(self):
+        return (entry[1] for entry in self.heap)
+
+    # Adds a state to the heap, if it is already in the heap its priority is lowered to the given one (and the stored
+    # state replaced by the given one), returns False when the state is already in the heap with a better priority
+    def push(self, item, priority):
+        index = self.position.get(item)
+        if index is None:
+            self.heap.append([priority, item])
+            self.position[item] = len(self.heap) - 1
+            self._sift_up(len(self.heap) - 1)
+            return True
+        entry = self.heap[index]
+        if not priority < entry[0]:
+            return False
+        entry[0] = priority
+        entry[1] = item
+        self._sift_up(index)
+        return True
+
+    # Removes and returns the (priority, state) with the lowest priority
+    def pop(self):
+        heap = self.heap
+        last = heap.pop()
+        if not heap:
+            del self.position[last[1]]
+            return last[0], last[1]
+        top = heap[0]
+        heap[0] = last
+        self.position[last[1]] = 0
+        del self.position[top[1]]
+        self._sift_down(0)
+        return top[0], top[1]
+
+    def peek(self):
+        return self.heap[0][0], self.heap[0][1]
+
+    # Removes a state from the heap, returns its priority
+    def remove(self, item):
+        heap = self.heap
+        index = self.position.pop(item)
+        entry = heap[index]
+        last = heap.pop()
+        if index < len(heap):
+            heap[index] = last
+            self.position[last[1]] = index
+            if last[0] < entry[0]:
+                self._sift_up(index)
+            else:
+                self._sift_down(index)
+        return entry[0]
+
+    def priority(self, item):
+        return self.heap[self.position[item]][0]
+
+    def _sift_up(self, index):
+        heap = self.heap
+        position = self.position
+        entry = heap[index]
+        while index > 0:
+            parent_index = (index - 1) >> 1
+            parent = heap[parent_index]
+            if not entry[0] < parent[0]:
+                break
+            heap[index] = parent
+            position[parent[1]] = index
+            index = parent_index
+        heap[index] = entry
+        position[entry[1]] = index
+
+    def _sift_down(self, index):
+        heap = self.heap
+        position = self.position
+        size = len(heap)
+        entry = heap[index]
+        child_index = 2 * index + 1
+        while child_index < size:
+            right_index = child_index + 1
+            if right_index < size and heap[right_index][0] < heap[child_index][0]:
+                child_index = right_index
+            child = heap[child_index]
+            if not child[0] < entry[0]:
+                break
+            heap[index] = child
+            position[child[1]] = index
+            index = child_index
+            child_index = 2 * index + 1
+        heap[index] = entry
+        position[entry[1]] = index
+
+
+# Tie breaking policies for the open set, each one builds the priority of a state out of its f, g and h scores and an
+# insertion counter. The counter makes every priority unique, so the heap never has to compare the states themselves
+TIE_BREAKERS = {
+    # equal f - smaller h first, then the first one inserted
+    'fifo': lambda f, g, h, counter: (f, h, counter),
+    # equal f - smaller h first, then the last one inserted
+    'lifo': lambda f, g, h, counter: (f, h, -counter),
+    # equal f - the deepest state (biggest g) first, then the first one inserted
+    'deeper': lambda f, g, h, counter: (f, -g, counter),
+}
+
+
+# Progress reports of a search, given to a search as progress it is called every check expansions and writes a report
+# once interval seconds passed since the last one (and a last report when the search ends). A report is a dict with
+# the algorithm, the seconds since the start, the expanded and generated states, the expansions per second since the
+# last report and since the start, and the values of the search (frontier, closed, best_f, bound, ...); it is written
+# as a JSON line to output and given to callback. With timing the reports also hold the seconds spent in the heuristic
+# and in generating the successors, this reads the clock around every evaluation and pour.
+# A search without progress only pays for a single check of progress per expansion
+class SearchProgress:
+    def __init__(self, interval=1.0, callback=None, output=None, timing=False, check=1024):
+        self.interval = interval
+        self.callback = callback
+        self.output = output
+        self.timing = timing
+        self.check = check
+        self.algorithm = None
+        self.heuristic = None
+        self.successor_time = 0.0
+        self.start_time = self.last_time = time.perf_counter()
+        self.last_expanded = 0
+
+    # Called when a search starts, returns the heuristic the search should use (a timed one with timing)
+    def start(self, algorithm, heuristic=None):
+        self.algorithm = algorithm
+        self.successor_time = 0.0
+        self.start_time = self.last_time = time.perf_counter()
+        self.last_expanded = 0
+        if self.timing and heuristic is not None:
+            self.heuristic = heuristic = TimedHeuristic(heuristic)
+        return heuristic
+
+    # Calls function(*args) and adds its time to the successor generation
+    def timed(self, function, *args):
+        start_time = time.perf_counter()
+        result = function(*args)
+        self.successor_time += time.perf_counter() - start_time
+        return result
+
+    def report(self, expanded, generated, final=False, **values):
+        now = time.perf_counter()
+        if not final and now - self.last_time < self.interval:
+            return
+        elapsed = now - self.start_time
+        record = {
+            'algorithm': self.algorithm,
+            'time': round(elapsed, 6),
+            'expanded': expanded,
+            'generated': generated,
+            'rate': (round((expanded - self.last_expanded) / (now - self.last_time), 1) if now > self.last_time
+                     else None),
+            'average_rate': round(expanded / elapsed, 1) if elapsed else None,
+        }
+        # JSON has no infinity, a bound or f that is not known yet is written as null
+        record.update((name, None if value == float('inf') else value) for name, value in values.items())
+        if self.timing:
+            record['heuristic_time'] = round(self.heuristic.time, 6) if self.heuristic is not None else None
+            record['successor_time'] = round(self.successor_time, 6)
+        if final:
+            record['final'] = True
+        self.last_time = now
+        self.last_expanded = expanded
+        if self.output is not None:
+            self.output.write(json.dumps(record) + "\n")
+            self.output.flush()
+        if self.callback is not None:
+            self.callback(record)
+
+
+# The operations of the puzzle classes measured by OperationProfiler, and the ones that return a generator (their time
+# is the time spent generating the items)
+PROFILED_OPERATIONS = ('get_neighbors', 'get_moves', 'pour', 'move', 'is_valid_move', 'is_goal', 'new_eq', '__init__',
+                       '__hash__', '__eq__', '__lt__')
+PROFILED_GENERATORS = ('get_moves',)
+PROFILED_HEURISTIC_OPERATIONS = ('__call__', 'start', 'after_pour')
+
+
+# Profiles a search broken down by operation. While the profiler runs, the operations of the puzzle classes and the
+# methods of every heuristic class are replaced by wrappers that count the calls and add up their time with
+# perf_counter_ns. The time of an operation is split into its own time and the time of the operations it calls (pour
+# builds the new state with __init__, a set lookup calls __hash__ and __eq__, ...), the own times are kept per stack
+# of operations and written as folded stacks, the input of flamegraph.pl and speedscope:
+#   solve;a_star;PackedPuzzle.pour;PackedPuzzle.__init__ 51234
+# The time of the search that is not spent in any operation is the own time of the root. The counts are exact, the
+# times include the cost of the wrappers (a fraction of a microsecond per call)
+class OperationProfiler:
+    def __init__(self, root='solve', classes=None, operations=PROFILED_OPERATIONS):
+        self.root = root
+        self.classes = classes if classes is not None else (LiquidPuzzle, PackedPuzzle)
+        self.operations = operations
+        # calls and total nanoseconds per operation, own nanoseconds per folded stack
+        self.calls = {}
+        self.times = {}
+        self.stacks = {}
+        self.keys = {}
+        self.path = [root]
+        self.children = [0]
+        self.originals = []
+        self.start_time = None
+        self.total = 0
+
+    def wrap(self, name, function, generator=False):
+        path, children, keys = self.path, self.children, self.keys
+        calls, times, stacks = self.calls, self.times, self.stacks
+        clock = time.perf_counter_ns
+        # The heuristic methods are named after the heuristic they belong to
+        named = name.startswith('.')
+
+        def enter(args):
+            label = args[0].name + name if named else name
+            parent = path[-1]
+            key = keys.get((parent, label))
+            if key is None:
+                key = keys[(parent, label)] = parent + ";" + label
+            path.append(key)
+            children.append(0)
+            return label, key
+
+        def leave(label, key, elapsed):
+            path.pop()
+            own = elapsed - children.pop()
+            children[-1] += elapsed
+            stacks[key] = stacks.get(key, 0) + own
+            times[label] = times.get(label, 0) + elapsed
+
+        # enter and leave written out, the wrapper of __hash__ runs for every lookup of a state
+        def wrapper(*args, **kwargs):
+            label = args[0].name + name if named else name
+            parent = path[-1]
+            key = keys.get((parent, label))
+            if key is None:
+                key = keys[(parent, label)] = parent + ";" + label
+            path.append(key)
+            children.append(0)
+            start = clock()
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                path.pop()
+                own = elapsed - children.pop()
+                children[-1] += elapsed
+                stacks[key] = stacks.get(key, 0) + own
+                times[label] = times.get(label, 0) + elapsed
+                calls[label] = calls.get(label, 0) + 1
+            return steps(args, result) if generator else result
+
+        def steps(args, items):
+            while True:
+                label, key = enter(args)
+                start = clock()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                finally:
+                    leave(label, key, clock() - start)
+                yield item
+
+        return wrapper
+
+    def start(self):
+        heuristic_classes = [IncrementalHeuristic]
+        for cls in heuristic_classes:
+            heuristic_classes.extend(cls.__subclasses__())
+        # A TimedHeuristic calls the heuristic it wraps, which has the same name, only the wrapped one is measured so
+        # every evaluation is counted once
+        heuristic_classes.remove(TimedHeuristic)
+        targets = [(cls, name, f"{cls.__name__}.{name}") for cls in self.classes for name in self.operations]
+        targets += [(cls, name, "." + name) for cls in heuristic_classes for name in PROFILED_HEURISTIC_OPERATIONS]
+        for cls, name, label in targets:
+            if name in cls.__dict__:
+                function = cls.__dict__[name]
+                self.originals.append((cls, name, function))
+                setattr(cls, name, self.wrap(label, function, name in PROFILED_GENERATORS))
+        self.path[:] = [self.root]
+        self.children[:] = [0]
+        self.start_time = time.perf_counter_ns()
+
+    def stop(self):
+        elapsed = time.perf_counter_ns() - self.start_time
+        self.total += elapsed
+        for cls, name, function in reversed(self.originals):
+            setattr(cls, name, function)
+        self.originals.clear()
+        self.stacks[self.root] = self.stacks.get(self.root, 0) + elapsed - self.children[0]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Writes the own time of every stack in microseconds, one "frame;frame;... value" line per stack
+    def write_folded(self, path):
+        with open(path, 'w') as file:
+            for stack, nanoseconds in sorted(self.stacks.items()):
+                if nanoseconds >= 1000:
+                    file.write(f"{stack} {nanoseconds // 1000}\n")
+
+    # (operation, calls, total seconds, microseconds per call) of every operation, the most expensive first
+    def summary(self):
+        return sorted(((label, self.calls[label], self.times[label] / 1e9, self.times[label] / self.calls[label] / 1e3)
+                       for label in self.calls), key=lambda row: -row[2])
+
+    def print_summary(self):
+        print(f"{'Operation':<40} {'Calls':>12} {'Seconds':>10} {'us/call':>9}")
+        for label, calls, seconds, per_call in self.summary():
+            print(f"{label:<40} {calls:>12} {seconds:>10.4f} {per_call:>9.3f}")
+        print(f"{'Total':<40} {'':>12} {self.total / 1e9:>10.4f}")
+
+
+# Seconds between two checkpoints of a_star, and the amount of expansions between two checks of the clock
+CHECKPOINT_INTERVAL = 300
+CHECKPOINT_CHECK = 1024
+
+
+# A star algorithm
+# heuristic is a heuristic function, an IncrementalHeuristic or the name of a registered heuristic (custom_heuristic by
+# default) and stats, when given, is a dict that gets the amount of expanded and generated states.
+# With a checkpoint path the whole search is saved to that file every checkpoint_interval seconds, a search that was
+# stopped is continued from the file with resume and gives the same path as a search that was never stopped. A puzzle
+# with colors of CHECKPOINT_PAD and above can not be checkpointed, a_star then raises ValueError before searching.
+# progress, when given, is a SearchProgress that gets reports of the search. Returns the Plan of the solution or None
+def a_star(initial_state, tie_break='fifo', heuristic=None, stats=None, checkpoint=None,
+           checkpoint_interval=CHECKPOINT_INTERVAL, progress=None):
+    if checkpoint is not None:
+        # Fails now rather than at the first checkpoint, after checkpoint_interval seconds of search
+        check_checkpoint(initial_state)
+    heuristic = incremental_heuristic(heuristic)
+    priority_key = TIE_BREAKERS[tie_break]
+    search = {
+        'initial_state': initial_state,
+        'open_set': OpenSet(),
+        # The node record of every state reached, a record is the move that reached the state (three numbers in
+        # moves) and the record of the state it was poured from (in parents, -1 for the initial state)
+        'came_from': {},
+        'parents': array.array('q'),
+        'moves': array.array(move_typecode(initial_state)),
+        'g_score': {initial_state: 0},
+        # The heuristic data of the states in the open set, used to score their neighbors incrementally
+        'h_data': {initial_state: heuristic.start(initial_state)},
+        'closed_set': set(),
+        'expanded': 0,
+        'generated': 0,
+        'inserted': 0,
+    }
+    h_value = heuristic.value(search['h_data'][initial_state])
+    search['open_set'].push(initial_state, priority_key(h_value, 0, h_value, 0))
+    return run_a_star(search, tie_break, heuristic, stats, checkpoint, checkpoint_interval, progress)
+
+
+# The main loop of a_star over the data of a search, a new one or one loaded from a checkpoint
+def run_a_star(search, tie_break, heuristic, stats=None, checkpoint=None, checkpoint_interval=CHECKPOINT_INTERVAL,
+               progress=None):
+    priority_key = TIE_BREAKERS[tie_break]
+    timing = False
+    if progress is not None:
+        heuristic = progress.start('a_star', heuristic)
+        timing = progress.timing
+    open_set = search['open_set']
+    came_from = search['came_from']
+    parents = search['parents']
+    moves = search['moves']
+    g_score = search['g_score']
+    h_data = search['h_data']
+    closed_set = search['closed_set']
+    inserted = search['inserted']
+    count = search['expanded']
+    generated = search['generated']
+    next_checkpoint = None if checkpoint is None else time.perf_counter() + checkpoint_interval
+    # The neighbors of an expansion are scored together by a batched heuristic, once all of them are known
+    batched = heuristic.batched
+    new_moves, new_states, waiting = [], [], []
+
+    while open_set:
+        if next_checkpoint is not None and count % CHECKPOINT_CHECK == 0 and time.perf_counter() >= next_checkpoint:
+            search.update(expanded=count, generated=generated, inserted=inserted)
+            save_checkpoint(checkpoint, search, tie_break, heuristic)
+            next_checkpoint = time.perf_counter() + checkpoint_interval
+        if progress is not None and count % progress.check == 0:
+            progress.report(count, generated, frontier=len(open_set), closed=len(closed_set),
+                            best_f=open_set.peek()[0][0])
+        priority, current = open_set.pop()
+        current_data = h_data.pop(current)
 
         if current.is_goal():
-            print(f"Total Count: {count}")
-            return reconstruct_path(came_from, current)
+            if stats is not None:
+                stats.update(expanded=count, generated=generated)
+            if progress is not None:
+                progress.report(count, generated, True, frontier=len(open_set), closed=len(closed_set),
+                                best_f=priority[0])
+            # The state popped is the one the last record of its came_from reached, so the moves replay exactly
+            return reconstruct_plan(search['initial_state'], parents, moves, came_from.get(current, -1))
 
         closed_set.add(current)
+        record = came_from.get(current, -1)
 
-        for neighbor in current.get_neighbors():
+        tubes = current.tubes
+        for tube_from, tube_to, amount in (progress.timed(list, current.get_moves()) if timing else
+                                           current.get_moves()):
+            if timing:
+                neighbor = progress.timed(current.pour, tube_from, tube_to, amount)
+            else:
+                neighbor = current.pour(tube_from, tube_to, amount)
+            generated += 1
             if neighbor in closed_set:
                 continue
 
             tentative_g_score = g_score[current] + 1
 
             if neighbor not in g_score or tentative_g_score < g_score[neighbor]:
-                came_from[neighbor] = current
+                came_from[neighbor] = len(parents)
+                parents.append(record)
+                moves.extend((tube_from, tube_to, amount))
                 g_score[neighbor] = tentative_g_score
-                f_score[neighbor] = g_score[neighbor] + heuristic(neighbor)
-                if neighbor not in g_score:
-                    open_set.put((f_score[neighbor], neighbor))
-                else:
-                    # Update the priority queue
-                    # Remove and reinsert the item to update its priority
-                    # This ensures the priority queue maintains the correct order
-                    open_set.queue = [(score, item) for score, item in open_set.queue if item != neighbor]
-                    open_set.put((f_score[neighbor], neighbor))
+                if batched:
+                    if neighbor not in h_data:
+                        new_moves.append((tube_from, tube_to, amount))
+                        new_states.append(neighbor)
+                    waiting.append(neighbor)
+                    continue
+                if neighbor not in h_data:
+                    h_data[neighbor] = heuristic.after_pour(current_data, neighbor, tube_from, tube_to,
+                                                            tubes[tube_from], tubes[tube_to])
+                h_value = heuristic.value(h_data[neighbor])
+                # Adds the neighbor or lowers its priority if it is already waiting in the open set
+                inserted += 1
+                open_set.push(neighbor, priority_key(tentative_g_score + h_value, tentative_g_score, h_value,
+                                                     inserted))
+        if batched:
+            # The same pushes in the same order as one neighbor at a time
+            h_data.update(zip(new_states, heuristic.after_pours(current, new_moves, new_states)))
+            tentative_g_score = g_score[current] + 1
+            for neighbor in waiting:
+                h_value = heuristic.value(h_data[neighbor])
+                inserted += 1
+                open_set.push(neighbor, priority_key(tentative_g_score + h_value, tentative_g_score, h_value,
+                                                     inserted))
+            new_moves.clear()
+            new_states.clear()
+            waiting.clear()
         count += 1
-    print(f"Total Count: {count}")
+    if stats is not None:
+        stats.update(expanded=count, generated=generated)
+    if progress is not None:
+        progress.report(count, generated, True, frontier=0, closed=len(closed_set))
     return None
 
-# A star algorithm
-def debug_a_star(initial_state,debug):
-    open_set = PriorityQueue()
-    open_set.put((0, initial_state))
+
+# Checkpoint file of a_star, all numbers little endian:
+#   header: magic, version, tubes, tube size, colors, then the tie breaking and heuristic names (u16 length + utf-8)
+#   counters: expanded, generated, inserted (u64)
+#   tubes: amount (u64) then every distinct tube as tube size bytes padded with CHECKPOINT_PAD
+#   states: amount (u64) then every state as the numbers of its tubes (u16, or u32 with more than 65535 tubes). The
+#     states keep their own order of tubes, so the moves of the node records still refer to the right tubes
+#   g scores: amount, then (state, g) pairs (u32), came from: amount, then (state, record) pairs (u32)
+#   node records: amount, then the parent of every record (i64) and its move (three u16, or u32 with more than 65535
+#     tubes or a tube size over 65535)
+#   closed set: amount, then states (u32), open set: amount, then (state u32, insertion counter u64)
+CHECKPOINT_MAGIC = b'LQCK'
+CHECKPOINT_VERSION = 2
+CHECKPOINT_PAD = 0xFF
+
+
+# Fails with ValueError when the states of a puzzle can not be written to a checkpoint, every state holds the colors of
+# the initial state and the tubes are written as bytes
+def check_checkpoint(initial_state):
+    if any(color >= CHECKPOINT_PAD for tube in initial_state.tubes for color in tube):
+        raise ValueError(f"Checkpoints support colors up to {CHECKPOINT_PAD - 1}")
+
+
+def save_checkpoint(path, search, tie_break, heuristic):
+    initial_state = search['initial_state']
+    tube_size = initial_state.tube_size
+    pad = bytes([CHECKPOINT_PAD])
+    check_checkpoint(initial_state)
+    # Every distinct tube and every distinct state object (by its own order of tubes) gets a number
+    tube_numbers = {}
+    numbers = {}
+    states = []
+
+    def number(state):
+        value = numbers.get(state.tubes)
+        if value is None:
+            value = numbers[state.tubes] = len(states)
+            states.append(state.tubes)
+        return value
+
+    number(initial_state)
+    g_scores = array.array('I')
+    for state, g in search['g_score'].items():
+        g_scores.extend((number(state), g))
+    came_from = array.array('I')
+    for state, record in search['came_from'].items():
+        came_from.extend((number(state), record))
+    closed = array.array('I', (number(state) for state in search['closed_set']))
+    open_states = array.array('I')
+    counters = array.array('Q')
+    for (priority, state) in search['open_set'].heap:
+        open_states.append(number(state))
+        counters.append(priority[-1])
+
+    state_tubes = array.array('I')
+    for tubes in states:
+        for tube in tubes:
+            value = tube_numbers.get(tube)
+            if value is None:
+                value = tube_numbers[tube] = len(tube_numbers)
+            state_tubes.append(value)
+    if len(tube_numbers) < 1 << 16:
+        state_tubes = array.array('H', state_tubes)
+
+    names = [name.encode() for name in (tie_break, heuristic.name)]
+    with open(path + ".tmp", 'wb') as file:
+        file.write(CHECKPOINT_MAGIC + struct.pack('<HIII', CHECKPOINT_VERSION, len(initial_state.tubes), tube_size,
+                                                  initial_state.colors))
+        for name in names:
+            file.write(struct.pack('<H', len(name)) + name)
+        file.write(struct.pack('<QQQQ', search['expanded'], search['generated'], search['inserted'],
+                               len(tube_numbers)))
+        file.write(b''.join(bytes(tube) + pad * (tube_size - len(tube)) for tube in tube_numbers))
+        file.write(struct.pack('<Q', len(states)))
+        file.write(state_tubes.tobytes())
+        for values in (g_scores, came_from):
+            file.write(struct.pack('<Q', len(values) // 2))
+            file.write(values.tobytes())
+        file.write(struct.pack('<Q', len(search['parents'])))
+        file.write(search['parents'].tobytes())
+        file.write(search['moves'].tobytes())
+        file.write(struct.pack('<Q', len(closed)))
+        file.write(closed.tobytes())
+        file.write(struct.pack('<Q', len(open_states)))
+        file.write(open_states.tobytes())
+        file.write(counters.tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+
+# Reads a checkpoint, returns (search, tie breaking name, heuristic name) with the search data of run_a_star
+def load_checkpoint(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    if data[:4] != CHECKPOINT_MAGIC:
+        raise ValueError(f"{path} is not an a_star checkpoint")
+    version, tubes_amount, tube_size, colors = struct.unpack_from('<HIII', data, 4)
+    if version != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {version}")
+    offset = 18
+    names = []
+    for _ in range(2):
+        length, = struct.unpack_from('<H', data, offset)
+        names.append(data[offset + 2:offset + 2 + length].decode())
+        offset += 2 + length
+    expanded, generated, inserted, tubes_total = struct.unpack_from('<QQQQ', data, offset)
+    offset += 32
+
+    pad = bytes([CHECKPOINT_PAD])
+    tubes = [data[offset + index * tube_size:offset + (index + 1) * tube_size].rstrip(pad)
+             for index in range(tubes_total)]
+    offset += tubes_total * tube_size
+
+    def read_array(typecode, amount):
+        nonlocal offset
+        values = array.array(typecode)
+        values.frombytes(data[offset:offset + amount * values.itemsize])
+        offset += amount * values.itemsize
+        return values
+
+    def read_amount():
+        nonlocal offset
+        amount, = struct.unpack_from('<Q', data, offset)
+        offset += 8
+        return amount
+
+    states_amount = read_amount()
+    state_tubes = read_array('H' if tubes_total < 1 << 16 else 'I', states_amount * tubes_amount)
+    states = [PackedPuzzle(tuple(map(tubes.__getitem__, state_tubes[index:index + tubes_amount])), colors, tube_size)
+              for index in range(0, len(state_tubes), tubes_amount)]
+    g_values = read_array('I', 2 * read_amount())
+    came_from_values = read_array('I', 2 * read_amount())
+    records = read_amount()
+    parents = read_array('q', records)
+    moves = read_array(move_typecode(states[0]), 3 * records)
+    closed_values = read_array('I', read_amount())
+    open_amount = read_amount()
+    open_values = read_array('I', open_amount)
+    counters = read_array('Q', open_amount)
+
+    search = {
+        'initial_state': states[0],
+        'open_set': OpenSet(),
+        'came_from': {states[came_from_values[index]]: came_from_values[index + 1]
+                      for index in range(0, len(came_from_values), 2)},
+        'parents': parents,
+        'moves': moves,
+        'g_score': {states[g_values[index]]: g_values[index + 1] for index in range(0, len(g_values), 2)},
+        'h_data': {},
+        'closed_set': {states[index] for index in closed_values},
+        'expanded': expanded,
+        'generated': generated,
+        'inserted': inserted,
+        # The open set is filled by resume, it needs the heuristic
+        'open_counters': [(states[index], counter) for index, counter in zip(open_values, counters)],
+    }
+    return search, names[0], names[1]
+
+
+# Continues an a_star search from a checkpoint, returns the same plan a_star would have returned. The heuristic is the
+# one the checkpoint was written with (by its registered name) unless another one is given, the search keeps saving
+# to the checkpoint file every checkpoint_interval seconds
+def resume(checkpoint, heuristic=None, stats=None, checkpoint_interval=CHECKPOINT_INTERVAL, progress=None):
+    search, tie_break, heuristic_name = load_checkpoint(checkpoint)
+    heuristic = incremental_heuristic(heuristic if heuristic is not None else heuristic_name)
+    priority_key = TIE_BREAKERS[tie_break]
+    g_score = search['g_score']
+    for state, counter in search.pop('open_counters'):
+        search['h_data'][state] = heuristic.start(state)
+        h_value = heuristic.value(search['h_data'][state])
+        g = g_score[state]
+        search['open_set'].push(state, priority_key(g + h_value, g, h_value, counter))
+    return run_a_star(search, tie_break, heuristic, stats, checkpoint, checkpoint_interval, progress)
+
+
+# The weights of anytime_a_star, the first solution is found with the biggest weight and every next one with a smaller
+ANYTIME_WEIGHTS = (5, 3, 2, 1.5, 1.25, 1)
+
+
+# Anytime Repairing A star (ARA*), a generator of better and better solutions. Every round is a weighted A star with
+# f = g + weight * h that reuses the search of the rounds before it: only the states whose g got smaller since they
+# were expanded are searched again. Every time the solution or its bound improves the generator yields (plan, bound),
+# the plan is at most bound times longer than the optimal one. The bound only holds when the heuristic never
+# overestimates, so it is None for every heuristic that is not in ADMISSIBLE_HEURISTICS (heuristic_second, the default,
+# is not) and a plan is yielded only when it is shorter. It stops when the bound gets to 1, when the weights are over
+# or when time_limit seconds passed, a better solution found in the round that the time limit cut short is yielded
+# before. A solved initial state gives the empty plan with a bound of 1 and nothing else. stats, when given, is a dict
+# that gets the amount of expanded and generated states and the weight of the last round, progress a SearchProgress
+# for reports
+def anytime_a_star(initial_state, weights=ANYTIME_WEIGHTS, heuristic=heuristic_second, time_limit=None, stats=None,
+                   progress=None):
+    heuristic = incremental_heuristic(heuristic)
+    timing = False
+    if progress is not None:
+        heuristic = progress.start('anytime_a_star', heuristic)
+        timing = progress.timing
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    if stats is None:
+        stats = {}
+    stats.update(expanded=0, generated=0, weight=weights[0])
+    # Node records like in a_star
     came_from = {}
+    parents = array.array('q')
+    moves = array.array(move_typecode(initial_state))
     g_score = {initial_state: 0}
-    f_score = {initial_state: heuristic(initial_state)}
+    h_data = {initial_state: heuristic.start(initial_state)}
+    h_score = {initial_state: heuristic.value(h_data[initial_state])}
     closed_set = set()
+    # States that got a smaller g after they were expanded, they are searched again in the next round
+    inconsistent = set()
+    goal = None
+    # The solution length and bound that were yielded last
+    published = (None, float('inf'))
+
+    open_set = OpenSet()
+    open_set.push(initial_state, (weights[0] * h_score[initial_state], 0))
+    inserted = 0
+
+    # The bound of ARA*, the solution divided by the smallest unweighted f that may still lead to a better one, at most
+    # limit. None when the heuristic may overestimate
+    admissible = heuristic.name in ADMISSIBLE_HEURISTICS
+
+    def solution_bound(limit):
+        if not admissible:
+            return None
+        lowest = min((g_score[state] + h_score[state] for state in list(open_set) + list(inconsistent)),
+                     default=incumbent)
+        return max(min(limit, incumbent / lowest) if lowest > 0 else limit, 1)
+
+    if initial_state.is_goal():
+        # No plan is shorter than the empty one
+        if progress is not None:
+            progress.report(0, 0, True, weight=weights[0], solution=0, bound=1)
+        yield reconstruct_plan(initial_state, parents, moves, -1), 1
+        return
+
+    for weight in weights:
+        stats['weight'] = weight
+        if weight != weights[0]:
+            # Next round, every state waiting in the open set or inconsistent is scored again with the new weight
+            waiting = list(open_set) + list(inconsistent)
+            open_set = OpenSet()
+            for state in waiting:
+                inserted += 1
+                open_set.push(state, (g_score[state] + weight * h_score[state], inserted))
+            inconsistent.clear()
+            closed_set.clear()
+
+        # The weighted f of the best goal, heuristics that are not 0 on a goal are fine too
+        incumbent = g_score[goal] if goal is not None else float('inf')
+        goal_f = incumbent + weight * h_score[goal] if goal is not None else float('inf')
+        while open_set and open_set.peek()[0][0] < goal_f:
+            if deadline is not None and time.perf_counter() > deadline:
+                if goal is not None and incumbent != published[0]:
+                    # The round is cut short, the better plan it found is still yielded. The weight of the round does
+                    # not bound it, the plan is at most as far from the optimal one as the plan yielded before it
+                    yield reconstruct_plan(initial_state, parents, moves, came_from[goal]), solution_bound(published[1])
+                if progress is not None:
+                    progress.report(stats['expanded'], stats['generated'], True, weight=weight,
+                                    solution=incumbent if goal is not None else None)
+                return
+            if progress is not None and stats['expanded'] % progress.check == 0:
+                progress.report(stats['expanded'], stats['generated'], frontier=len(open_set),
+                                closed=len(closed_set), best_f=open_set.peek()[0][0], weight=weight,
+                                solution=incumbent if goal is not None else None)
+            current = open_set.pop()[1]
+            current_data = h_data.pop(current, None)
+            if current_data is None:
+                current_data = heuristic.start(current)
+            closed_set.add(current)
+            stats['expanded'] += 1
+            record = came_from.get(current, -1)
+
+            g = g_score[current] + 1
+            tubes = current.tubes
+            for tube_from, tube_to, amount in (progress.timed(list, current.get_moves()) if timing else
+                                               current.get_moves()):
+                if timing:
+                    neighbor = progress.timed(current.pour, tube_from, tube_to, amount)
+                else:
+                    neighbor = current.pour(tube_from, tube_to, amount)
+                stats['generated'] += 1
+                if neighbor in g_score and g >= g_score[neighbor]:
+                    continue
+                came_from[neighbor] = len(parents)
+                parents.append(record)
+                moves.extend((tube_from, tube_to, amount))
+                g_score[neighbor] = g
+                if neighbor not in h_data:
+                    h_data[neighbor] = heuristic.after_pour(current_data, neighbor, tube_from, tube_to,
+                                                            tubes[tube_from], tubes[tube_to])
+                    h_score[neighbor] = heuristic.value(h_data[neighbor])
+                if neighbor.is_goal():
+                    # A goal is never expanded, a shorter path to a goal is the new incumbent
+                    if g < incumbent:
+                        goal, incumbent = neighbor, g
+                        goal_f = g + weight * h_score[neighbor]
+                    continue
+                if neighbor in closed_set:
+                    # The object kept is the one the new record reached, so the moves of the records replay exactly
+                    inconsistent.discard(neighbor)
+                    inconsistent.add(neighbor)
+                else:
+                    inserted += 1
+                    open_set.push(neighbor, (g + weight * h_score[neighbor], inserted))
+
+        if goal is None:
+            if not open_set and not inconsistent:
+                if progress is not None:
+                    progress.report(stats['expanded'], stats['generated'], True, weight=weight, solution=None)
+                return
+            continue
+        bound = solution_bound(weight)
+        if incumbent != published[0] or bound is not None and bound < published[1]:
+            published = (incumbent, bound)
+            yield reconstruct_plan(initial_state, parents, moves, came_from[goal]), bound
+        if bound is not None and bound <= 1:
+            if progress is not None:
+                progress.report(stats['expanded'], stats['generated'], True, weight=weight, solution=incumbent,
+                                bound=bound)
+            return
+    if progress is not None:
+        progress.report(stats['expanded'], stats['generated'], True, weight=weights[-1],
+                        solution=g_score[goal] if goal is not None else None)
+
+
+# Runs anytime_a_star for time_limit seconds, calls callback(plan, bound) for every better solution (the bound is None
+# when the heuristic is not admissible) and returns the best plan found (None when no solution was found in time)
+def anytime_solve(initial_state, time_limit, callback=None, weights=ANYTIME_WEIGHTS, heuristic=heuristic_second,
+                  stats=None, progress=None):
+    best = None
+    for plan, bound in anytime_a_star(initial_state, weights, heuristic, time_limit, stats, progress):
+        best = plan
+        if callback is not None:
+            callback(plan, bound)
+    return best
+
+
+# A state in the node table of bounded_a_star, it replaces the g_score, came_from, f_score and closed_set of a_star.
+# parent is the node of the parent, children the amount of nodes in the table whose parent it is, data the heuristic
+# data while the node waits in the open set, and forgotten the smallest f of the children that were pruned
+class SearchNode:
+    __slots__ = ('state', 'g', 'h', 'parent', 'children', 'data', 'closed', 'forgotten')
+
+    def __init__(self, state, g, h, parent, data):
+        self.state = state
+        self.g = g
+        self.h = h
+        self.parent = parent
+        self.children = 0
+        self.data = data
+        self.closed = False
+        self.forgotten = float('inf')
+
+
+# A rough size in bytes of a node of bounded_a_star holding the given state: the state with its tubes and canonical key,
+# the node, its entry in the node table and in the open set
+def node_bytes(state):
+    size = sys.getsizeof(state) + sys.getsizeof(state.tubes) + sys.getsizeof(state.key)
+    size += sum(sys.getsizeof(tube) for tube in state.tubes)
+    size += sys.getsizeof(SearchNode(state, 0, 0, None, None))
+    # the node table and the position of the open set (dict entries), and the heap entry with its priority
+    return size + 2 * 100 + 150
+
+
+# Memory bounded A star, a simplified SMA*. All the nodes are kept in a single table of at most max_nodes nodes (or
+# max_bytes bytes, measured with node_bytes). When the successors of a state do not fit, nodes are pruned first until
+# the table is back to 7/8 of its size: expanded nodes without children in the table and then the worst leaves of the
+# open set. A pruned leaf gives its f to its parent, and a parent that lost all of its children goes back to the open
+# set with that f, so it is expanded again (and the pruned part searched again) only when it is the best state left.
+# Successors that still do not fit are forgotten the same way, the best ones are kept. A successor as deep as the
+# table is big is kept only when it is solved, it could not have children of its own.
+# The path found is the one of a_star as long as the search fits in memory. A table only a little bigger than the
+# solution is long means searching the same states again and again. The search gives up and returns None when the
+# successors of the best state left can not fit next to its path, or when a prune frees no room or frees the same
+# states as an earlier one (the search went round in a circle).
+# stats, when given, is a dict that gets the amount of expanded, generated and pruned states and the biggest size of
+# the table, progress a SearchProgress for reports
+def bounded_a_star(initial_state, max_nodes=None, max_bytes=None, heuristic=None, tie_break='fifo', stats=None,
+                   progress=None):
+    heuristic = incremental_heuristic(heuristic)
+    timing = False
+    if progress is not None:
+        heuristic = progress.start('bounded_a_star', heuristic)
+        timing = progress.timing
+    priority_key = TIE_BREAKERS[tie_break]
+    if max_bytes is not None:
+        by_bytes = max(max_bytes // node_bytes(initial_state), 2)
+        max_nodes = by_bytes if max_nodes is None else min(max_nodes, by_bytes)
+    if stats is None:
+        stats = {}
+    stats.update(expanded=0, generated=0, pruned=0, peak_nodes=1)
+
+    data = heuristic.start(initial_state)
+    root = SearchNode(initial_state, 0, heuristic.value(data), None, data)
+    nodes = {initial_state: root}
+    open_set = OpenSet()
+    inserted = 0
+    open_set.push(initial_state, priority_key(root.h, 0, root.h, inserted))
+    # The hashes of the sets of states freed by every prune
+    pruned = set()
+
+    # Removes nodes until the table holds at most target nodes (and at most 7/8 of max_nodes), returns the set of the
+    # states removed. Closed nodes without children in the table (their neighbors were all reached before them) go
+    # first, they are dead weight, then the worst leaves of the open set. current is being expanded and is kept
+    def prune(target, current):
+        nonlocal inserted
+        target = min(target, max_nodes - max(max_nodes // 8, 1))
+        freed = set()
+        dead = [node for node in nodes.values() if node.closed and node.children == 0 and node is not root
+                and node is not current]
+        leaves = sorted((entry for entry in open_set.heap if nodes[entry[1]].children == 0 and nodes[entry[1]] is not
+                         root), key=lambda entry: entry[0])
+        while len(nodes) > target and (dead or leaves):
+            if dead:
+                node = dead.pop()
+                if not node.closed or node.children or nodes.get(node.state) is not node:
+                    continue
+                del nodes[node.state]
+            else:
+                priority, state = leaves.pop()
+                if state not in open_set:
+                    continue
+                node = nodes.pop(state)
+                open_set.remove(state)
+                node.parent.forgotten = min(node.parent.forgotten, priority[0])
+            stats['pruned'] += 1
+            freed.add(node.state)
+            parent = node.parent
+            parent.children -= 1
+            if parent.closed and parent.children == 0 and parent is not root:
+                if parent.forgotten != float('inf'):
+                    # All the children of the parent are gone, it has to be expanded again to get them back
+                    parent.closed = False
+                    inserted += 1
+                    open_set.push(parent.state, priority_key(parent.forgotten, parent.g, parent.h, inserted))
+                else:
+                    dead.append(parent)
+        return frozenset(freed)
 
-    saved = initial_state
-    count = 0
-    while not open_set.empty():
-        current = open_set.get()[1]
+    def give_up():
+        if progress is not None:
+            progress.report(stats['expanded'], stats['generated'], True, nodes=len(nodes), pruned=stats['pruned'])
+        return None
+
+    while True:
+        if not open_set:
+            # A parent whose other children are dead ends is never reopened by prune, the states it forgot are
+            # searched again once nothing else is left
+            for node in nodes.values():
+                if node.closed and node.forgotten != float('inf'):
+                    node.closed = False
+                    inserted += 1
+                    open_set.push(node.state, priority_key(node.forgotten, node.g, node.h, inserted))
+            if not open_set:
+                return give_up()
+        if progress is not None and stats['expanded'] % progress.check == 0:
+            progress.report(stats['expanded'], stats['generated'], frontier=len(open_set), nodes=len(nodes),
+                            pruned=stats['pruned'], best_f=open_set.peek()[0][0])
+        current = nodes[open_set.pop()[1]]
+        if current.state.is_goal():
+            if progress is not None:
+                progress.report(stats['expanded'], stats['generated'], True, frontier=len(open_set),
+                                nodes=len(nodes), pruned=stats['pruned'], best_f=current.g + current.h)
+            path = []
+            node = current
+            while node is not None:
+                path.append(node.state)
+                node = node.parent
+            # A node keeps the state it was first reached with, the path is aligned to the moves of its parents
+            return Plan.from_states(align_path(path[::-1]))
+
+        current.closed = True
+        current.forgotten = float('inf')
+        if max_nodes is not None and current.g + 2 > max_nodes:
+            # The path to a child of the best state left does not fit in the table
+            return give_up()
+        current_data = current.data if current.data is not None else heuristic.start(current.state)
+        current.data = None
+        stats['expanded'] += 1
+
+        g = current.g + 1
+        state = current.state
+        tubes = state.tubes
+        # The successors that are new or reached with a shorter path, as neighbor: (f, tube_from, tube_to, data)
+        successors = {}
+        for tube_from, tube_to, amount in (progress.timed(list, state.get_moves()) if timing else
+                                           state.get_moves()):
+            if timing:
+                neighbor = progress.timed(state.pour, tube_from, tube_to, amount)
+            else:
+                neighbor = state.pour(tube_from, tube_to, amount)
+            stats['generated'] += 1
+            node = nodes.get(neighbor)
+            if node is not None and (node.closed or g >= node.g) or neighbor in successors:
+                continue
+            if node is not None:
+                successors[neighbor] = (g + node.h, tube_from, tube_to, None)
+            elif max_nodes is None or g + 1 < max_nodes or neighbor.is_goal():
+                data = heuristic.after_pour(current_data, neighbor, tube_from, tube_to, tubes[tube_from],
+                                            tubes[tube_to])
+                successors[neighbor] = (g + heuristic.value(data), tube_from, tube_to, data)
+
+        order = successors.items()
+        if max_nodes is not None:
+            new = sum(neighbor not in nodes for neighbor in successors)
+            if len(nodes) + new > max_nodes:
+                freed = prune(max_nodes - new, current)
+                if len(nodes) >= max_nodes or hash(freed) in pruned:
+                    return give_up()
+                if freed:
+                    pruned.add(hash(freed))
+                # The best successors get the room left
+                order = sorted(order, key=lambda item: item[1][0])
+        for neighbor, (f, tube_from, tube_to, data) in order:
+            node = nodes.get(neighbor)
+            if node is None:
+                if max_nodes is not None and len(nodes) >= max_nodes:
+                    current.forgotten = min(current.forgotten, f)
+                    continue
+                if data is None:
+                    # The node was pruned to make room
+                    data = heuristic.after_pour(current_data, neighbor, tube_from, tube_to, tubes[tube_from],
+                                                tubes[tube_to])
+                node = nodes[neighbor] = SearchNode(neighbor, g, f - g, current, data)
+            else:
+                node.parent.children -= 1
+                node.g = g
+                node.parent = current
+            current.children += 1
+            inserted += 1
+            open_set.push(neighbor, priority_key(f, g, node.h, inserted))
+
+        if len(nodes) > stats['peak_nodes']:
+            stats['peak_nodes'] = len(nodes)
+
+
+# The solved state of a puzzle (up to the order of the tubes), every color in full tubes and the other tubes empty.
+# None when a color can not fill whole tubes
+def goal_state(state):
+    amounts = {}
+    for tube in state.tubes:
+        for color in tube:
+            amounts[color] = amounts.get(color, 0) + 1
+    tubes = []
+    for color, amount in sorted(amounts.items()):
+        if amount % state.tube_size:
+            return None
+        tubes += [[color] * state.tube_size] * (amount // state.tube_size)
+    if len(tubes) > len(state.tubes):
+        return None
+    tubes += [[]] * (len(state.tubes) - len(tubes))
+    return PackedPuzzle.from_tubes(tubes, state.colors, state.tube_size)
+
+
+# Bidirectional breadth first search, a search forward from the start with the pours and a search backward from the
+# goal with the reverse pours (see reverse_pour_moves), the side with the smaller frontier expands a whole layer at a
+# time. The states of both sides are kept in dicts by their canonical form, and every new state of a layer is looked up
+# in the dict of the other side (a hash join on the state keys), the shortest path through the states met in that
+# layer is the shortest path of the puzzle. Both searches only go half way, for deep puzzles with a similar branching
+# forward and backward this expands about the square root of the states of a one sided breadth first search.
+# Returns the Plan of a shortest path or None, stats and progress are like in a_star
+def bidirectional_search(initial_state, max_depth=None, stats=None, progress=None):
+    goal = goal_state(initial_state)
+    if progress is not None:
+        progress.start('bidirectional')
+    # state: (the state one step closer to the start or goal, depth)
+    sides = [{initial_state: (None, 0)}, {}]
+    frontiers = [[initial_state], []]
+    if goal is not None:
+        sides[1][goal] = (None, 0)
+        frontiers[1].append(goal)
+    depths = [0, 0]
+    expanded = generated = 0
+    meeting = initial_state if initial_state in sides[1] else None
+
+    while meeting is None and frontiers[0] and frontiers[1]:
+        if max_depth is not None and depths[0] + depths[1] >= max_depth:
+            break
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        visited, other = sides[side], sides[1 - side]
+        depth = depths[side] + 1
+        layer = []
+        best = None
+        for state in frontiers[side]:
+            if progress is not None and expanded % progress.check == 0:
+                progress.report(expanded, generated, forward=len(sides[0]), backward=len(sides[1]),
+                                forward_depth=depths[0], backward_depth=depths[1])
+            expanded += 1
+            if side == 0:
+                neighbors = [state.pour(*move) for move in state.get_moves()]
+            else:
+                neighbors = [state.unpour(*move) for move in state.get_reverse_moves()]
+            for neighbor in neighbors:
+                generated += 1
+                if neighbor in visited:
+                    continue
+                visited[neighbor] = (state, depth)
+                layer.append(neighbor)
+                found = other.get(neighbor)
+                if found is not None and (best is None or found[1] < other[best][1]):
+                    best = neighbor
+        frontiers[side] = layer
+        depths[side] = depth
+        meeting = best
+
+    if stats is not None:
+        stats.update(expanded=expanded, generated=generated, forward=len(sides[0]), backward=len(sides[1]))
+    if progress is not None:
+        progress.report(expanded, generated, True, forward=len(sides[0]), backward=len(sides[1]),
+                        forward_depth=depths[0], backward_depth=depths[1])
+    if meeting is None:
+        return None
+    # The start half walks back to the start, the goal half walks on to the goal
+    path = []
+    state = meeting
+    while state is not None:
+        path.append(state)
+        state = sides[0][state][0]
+    path.reverse()
+    state = sides[1][meeting][0]
+    while state is not None:
+        path.append(state)
+        state = sides[1][state][0]
+    path[0] = initial_state
+    return Plan.from_states(align_path(path))
+
+
+# The working state of IDA-star, a single mutable puzzle that is changed in place by apply and changed back by undo.
+# unsolved counts the tubes that are neither empty nor full of a single color.
+class WorkingPuzzle:
+    __slots__ = ('tubes', 'streaks', 'colors', 'tube_size', 'unsolved')
+
+    def __init__(self, state):
+        self.tubes = list(state.tubes)
+        self.streaks = [top_streak(tube) for tube in self.tubes]
+        self.colors = state.colors
+        self.tube_size = state.tube_size
+        self.unsolved = sum(1 for index in range(len(self.tubes)) if not self.is_solved(index))
+
+    def is_solved(self, index):
+        return not self.tubes[index] or self.streaks[index] == self.tube_size
 
-        if count == 4066 or count == 2118 :
-            print("-" * 30)
-            print(f"Step {count}: score {f_score[current]} - {current}")
-            current.special_print()
-            print("-"*30)
+    def is_goal(self):
+        return self.unsolved == 0
+
+    # The tubes in a canonical order, the same for every order of the tubes like the key of PackedPuzzle
+    def key(self):
+        return tuple(sorted(self.tubes))
+
+    def get_moves(self):
+        return pour_moves(self.tubes, self.streaks, self.tube_size)
+
+    # Pours the top amount units of tube_from on tube_to
+    def apply(self, tube_from, tube_to, amount):
+        tubes = self.tubes
+        streaks = self.streaks
+        source = tubes[tube_from]
+        target = tubes[tube_to]
+        unsolved = self.unsolved - (not self.is_solved(tube_from)) - (not self.is_solved(tube_to))
+        tubes[tube_from] = source[amount:]
+        tubes[tube_to] = source[:amount] + target
+        streaks[tube_from] = top_streak(tubes[tube_from])
+        streaks[tube_to] += amount
+        self.unsolved = unsolved + (not self.is_solved(tube_from)) + (not self.is_solved(tube_to))
+
+    # Takes back apply(tube_from, tube_to, amount), source and target are the two tubes before the pour
+    def undo(self, tube_from, tube_to, amount, source, target):
+        tubes = self.tubes
+        streaks = self.streaks
+        unsolved = self.unsolved - (not self.is_solved(tube_from)) - (not self.is_solved(tube_to))
+        tubes[tube_from] = source
+        tubes[tube_to] = target
+        streaks[tube_from] = amount
+        streaks[tube_to] -= amount
+        self.unsolved = unsolved + (not self.is_solved(tube_from)) + (not self.is_solved(tube_to))
+
+
+# The Algorithm for IDA-star, an iterative version that makes and takes back the moves on a single working state.
+# The moves of the current path are kept in a preallocated stack, and a transposition table of at most table_size
+# states remembers the smallest g each state was reached with in the current iteration, a state reached again with the
+# same or a bigger g is not searched again. The table and the states of the current path are keyed by the canonical
+# tubes of the states, so two different states are never taken for the same one. heuristic is chosen like in a_star.
+# stats, when given, is a dict that gets the amount of expanded and generated states and the amount of iterations,
+# progress a SearchProgress for reports
+def ida_star(initial_state, heuristic=None, table_size=1 << 20, stats=None, progress=None):
+    heuristic = incremental_heuristic(heuristic)
+    timing = False
+    if progress is not None:
+        heuristic = progress.start('ida_star', heuristic)
+        timing = progress.timing
+    if stats is None:
+        stats = {}
+    stats.update(expanded=0, generated=0, iterations=0)
+    work = WorkingPuzzle(initial_state)
+    initial_data = heuristic.start(initial_state)
+    bound = heuristic.value(initial_data)
+
+    # The stack, one entry for every depth of the current path
+    capacity = 64
+    moves_at = [None] * capacity
+    data_at = [None] * capacity
+    path = [None] * capacity
+    sources_at = [None] * capacity
+    targets_at = [None] * capacity
+    # The key of the state at every depth of the current path
+    keys_at = [None] * capacity
+    table = {}
 
-        if count == 2118:
-            saved = current
+    while True:
+        stats['iterations'] += 1
+        next_bound = float('inf')
+        table.clear()
+        keys_at[0] = work.key()
+        table[keys_at[0]] = 0
+        on_path = {keys_at[0]}
+        depth = 0
+        data_at[0] = initial_data
+        moves_at[0] = None
+
+        while depth >= 0:
+            moves = moves_at[depth]
+            if moves is None:
+                # First visit of the node at this depth
+                f = depth + heuristic.value(data_at[depth])
+                if f > bound:
+                    if f < next_bound:
+                        next_bound = f
+                    moves = ()
+                elif work.is_goal():
+                    if progress is not None:
+                        progress.report(stats['expanded'], stats['generated'], True, depth=depth, table=len(table),
+                                        bound=bound, iteration=stats['iterations'])
+                    return Plan(initial_state, path[:depth])
+                else:
+                    if timing:
+                        moves = moves_at[depth] = iter(progress.timed(list, work.get_moves()))
+                    else:
+                        moves = moves_at[depth] = work.get_moves()
+                    stats['expanded'] += 1
+                    if progress is not None and stats['expanded'] % progress.check == 0:
+                        progress.report(stats['expanded'], stats['generated'], depth=depth, table=len(table),
+                                        best_f=f, bound=bound, next_bound=next_bound, iteration=stats['iterations'])
+
+            move = next(iter(moves), None)
+            if move is None:
+                # Backtrack
+                moves_at[depth] = None
+                depth -= 1
+                if depth >= 0:
+                    on_path.discard(keys_at[depth + 1])
+                    tube_from, tube_to, amount = path[depth]
+                    work.undo(tube_from, tube_to, amount, sources_at[depth], targets_at[depth])
+                continue
 
-        if count >= 2188 and current == saved:
-            print(count)
+            tube_from, tube_to, amount = move
+            source = work.tubes[tube_from]
+            target = work.tubes[tube_to]
+            if timing:
+                progress.timed(work.apply, tube_from, tube_to, amount)
+            else:
+                work.apply(tube_from, tube_to, amount)
+            stats['generated'] += 1
+            g = depth + 1
+            key = work.key()
+            if key in on_path or table.get(key, g + 1) <= g:
+                work.undo(tube_from, tube_to, amount, source, target)
+                continue
+            if len(table) >= table_size:
+                # Forget the oldest entry
+                del table[next(iter(table))]
+            table[key] = g
+            on_path.add(key)
+
+            if g == capacity:
+                moves_at.extend([None] * capacity)
+                data_at.extend([None] * capacity)
+                path.extend([None] * capacity)
+                sources_at.extend([None] * capacity)
+                targets_at.extend([None] * capacity)
+                keys_at.extend([None] * capacity)
+                capacity *= 2
+            path[depth] = move
+            sources_at[depth] = source
+            targets_at[depth] = target
+            keys_at[g] = key
+            data_at[g] = heuristic.after_pour(data_at[depth], work, tube_from, tube_to, source, target)
+            moves_at[g] = None
+            depth = g
+
+        if next_bound == float('inf'):
+            if progress is not None:
+                progress.report(stats['expanded'], stats['generated'], True, bound=bound,
+                                iteration=stats['iterations'])
+            return None
+        bound = next_bound
 
-        if count >= 2189:
-            for item in open_set.queue:
-                if item[1] == saved:
-                    print("shit")
-            # test2  = 0
-            # if any(saved in item for item in open_set.queue):
-            #     print(count)
 
-        #debug
-        if current in debug:
-            print(f"{count}:F Score {f_score[current]}, step number {debug[current]} - {current}")
+# The array type of the moves of a puzzle, unsigned shorts unless a tube number or an amount does not fit in them
+def move_typecode(state):
+    return 'H' if len(state.tubes) <= 0xFFFF and state.tube_size <= 0xFFFF else 'I'
 
-        if current.is_goal():
-            return reconstruct_path(came_from, current)
 
-        # if count >= 2118:
-        if count == 4066:
-            print(f"Test 1: {saved in closed_set}")
-            print(f"Test 2: {current in closed_set}")
-            print(f"Test 3")
-            print(saved.__hash__() == current.__hash__())
+# A solution, the initial state and the moves (tube_from, tube_to, amount) that solve it, kept in a flat array of three
+# numbers per move instead of a list of full states. len(plan) is the number of moves, plan[index] and iterating give
+# the moves, and the states are only rebuilt when they are asked for: plan.states() replays them one at a time
+class Plan:
+    __slots__ = ('initial_state', 'data')
 
-        closed_set.add(current)
+    def __init__(self, initial_state, moves=()):
+        self.initial_state = initial_state
+        self.data = array.array(move_typecode(initial_state))
+        for move in moves:
+            self.data.extend(move)
 
-        neighbors = current.get_neighbors()
-        for neighbor in neighbors:
-            if neighbor in closed_set:
-                continue
+    # The plan of a path of states, every state a single move away from the one before it
+    @classmethod
+    def from_states(cls, states):
+        return cls(states[0], path_moves(states))
 
-            tentative_g_score = g_score[current] + 1
-            if neighbor not in g_score or tentative_g_score < g_score[neighbor]:
-                came_from[neighbor] = current
-                g_score[neighbor] = tentative_g_score
-                f_score[neighbor] = g_score[neighbor] + heuristic(neighbor)
-                if neighbor not in g_score:
-                  open_set.put((f_score[neighbor], neighbor))
-                else:
-                    open_set.queue = [(score, item) for score, item in open_set.queue if item != neighbor]
-                    open_set.put((f_score[neighbor], neighbor))
+    def __len__(self):
+        return len(self.data) // 3
 
-        count += 1
-    return None
+    # A plan is a solution even without moves (the initial state is solved), like the one state path it replaces
+    def __bool__(self):
+        return True
 
-# Reconstructs the path found with A star
-def reconstruct_path(came_from, current):
-    total_path = [current]
-    while current in came_from:
-        current = came_from[current]
-        total_path.append(current)
-    return total_path[::-1]
-
-
-# The Algorithm for IDA-star
-def ida_star(initial_state):
-    def search(node, g, bound):
-        f = g + heuristic(node)
-        if f > bound:
-            return f, None
-        if node.is_goal():
-            return True, [node]
-        min_bound = float('inf')
-        for neighbor in node.get_neighbors():
-            if neighbor in visited:
-                continue
-            visited.add(neighbor)
-            temp_bound, path = search(neighbor, g + 1, bound)
-            if temp_bound is True:
-                return True, [node] + path
-            if temp_bound < min_bound:
-                min_bound = temp_bound
-            visited.remove(neighbor)
-        return min_bound, None
-
-    bound = heuristic(initial_state)
-    visited = {initial_state}
-    while True:
-        temp_bound, path = search(initial_state, 0, bound)
-        if temp_bound is True:
-            return path
-        if temp_bound == float('inf'):
-            return None
-        bound = temp_bound
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return tuple(self.data[3 * index:3 * index + 3])
+
+    def __iter__(self):
+        data = self.data
+        for index in range(0, len(data), 3):
+            yield data[index], data[index + 1], data[index + 2]
+
+    def __repr__(self):
+        return f"Plan({len(self)} moves)"
+
+    # The states of the plan from the initial state to the goal, replayed one at a time
+    def states(self):
+        state = self.initial_state
+        yield state
+        for tube_from, tube_to, amount in self:
+            state = state.pour(tube_from, tube_to, amount)
+            yield state
+
+    def final_state(self):
+        state = None
+        for state in self.states():
+            pass
+        return state
+
+
+# The plan that ends with the move of a node record of a search, parents holds the record of the parent of every record
+# (-1 for the initial state) and moves the three numbers of its move
+def reconstruct_plan(initial_state, parents, moves, record):
+    records = []
+    while record >= 0:
+        records.append(record)
+        record = parents[record]
+    plan = Plan(initial_state)
+    for record in reversed(records):
+        plan.data.extend(moves[3 * record:3 * record + 3])
+    return plan
+
+
+# Rebuilds the states of a path from the initial state and the moves (tube_from, tube_to, amount)
+def replay_path(initial_state, moves):
+    states = [initial_state]
+    for tube_from, tube_to, amount in moves:
+        states.append(states[-1].pour(tube_from, tube_to, amount))
+    return states
+
+
+# Rebuilds a path whose states are only known up to the order of their tubes (states are compared in their canonical
+# form) so that every step is a real move from the state before it. The first state is kept and every next state is
+# the neighbor equal to it, so the tube numbers of the whole path are the ones of the first state
+def align_path(path):
+    states = [path[0]]
+    for state in path[1:]:
+        current = states[-1]
+        for tube_from, tube_to, amount in current.get_moves():
+            neighbor = current.pour(tube_from, tube_to, amount)
+            if neighbor == state:
+                states.append(neighbor)
+                break
+        else:
+            raise ValueError("The path has a step that is not a legal move")
+    return states
+
+
+# The moves (tube_from, tube_to, amount) between the states of a path
+def path_moves(path):
+    moves = []
+    for state, next_state in zip(path, path[1:]):
+        tube_from = tube_to = None
+        for index, (tube, next_tube) in enumerate(zip(state.tubes, next_state.tubes)):
+            if len(next_tube) < len(tube):
+                tube_from = index
+            elif len(next_tube) > len(tube):
+                tube_to = index
+        moves.append((tube_from, tube_to, len(state.tubes[tube_from]) - len(next_state.tubes[tube_from])))
+    return moves
 
 
 # An auxiliary function used mainly for UI
@@ -564,9 +2315,9 @@ def test_ida_star():
         "[[], [], [0, 4, 1, 4, 5, 0], [5, 2, 5, 2, 1, 5], [3, 1, 3, 3, 4, 0], [2, 4, 1, 0, 3, 0], [0, 3, 4, 2, 2, 1], "
         "[2, 5, 1, 5, 4, 3]]")
     print("start")
-    path = ida_star(initial_state)
+    path = ida_star(PackedPuzzle.pack(initial_state))
     if path:
-        for step in path:
+        for step in path.states():
             print(step)
     else:
         print("No solution found.")
@@ -576,66 +2327,80 @@ def test_ida_star():
 # An auxiliary function used mainly for UI
 def test_a_star():
     initial_state = LiquidPuzzle("[[], [0, 1, 1], [2, 0, 1], [0, 2, 2]]")
-    path = a_star(initial_state)
+    path = a_star(PackedPuzzle.pack(initial_state))
     if path:
-        for step in path:
+        for step in path.states():
             print(step)
     else:
         print("No solution found.")
 
 
 # UI, Solves an liquid puzzle with our algorithm
-def solve(initial_state):
-    # debug
-    # initial_state = LiquidPuzzle("[[], [0, 1, 1], [2, 0, 1], [0, 2, 2]]")
-    debug = {}
-
+# with more than one worker the search runs in parallel over that many processes (see parallel_search), heuristic is
+# a heuristic function or the name of a registered heuristic (see HEURISTICS), custom_heuristic by default. With a
+# checkpoint path the search is saved to it every CHECKPOINT_INTERVAL seconds, and continued from it when it exists.
+# progress, when given, is a SearchProgress that gets reports while the search runs, for example
+# SearchProgress(output=sys.stderr) writes a JSON line every second.
+# With a profile path the search runs under an OperationProfiler, the calls and time of every operation are printed
+# and the folded stacks are written to the file (flamegraph.pl profile.folded > profile.svg)
+def solve(initial_state, tie_break='fifo', workers=1, heuristic=None, checkpoint=None, progress=None, profile=None):
+    stats = {}
+    profiler = None
+    resuming = checkpoint is not None and os.path.exists(checkpoint)
+    if profile is not None:
+        if workers > 1:
+            raise ValueError("Profiling runs the search in a single process")
+        profiler = OperationProfiler("solve;resume" if resuming else "solve;a_star")
+        profiler.start()
     start_time = time.perf_counter()
-    path = a_star(initial_state)
+    try:
+        if workers > 1:
+            from parallel_search import parallel_a_star
+            path = parallel_a_star(PackedPuzzle.pack(initial_state), workers, heuristic, tie_break, stats=stats,
+                                   progress=progress)
+        elif resuming:
+            path = resume(checkpoint, heuristic, stats, progress=progress)
+        else:
+            path = a_star(PackedPuzzle.pack(initial_state), tie_break, heuristic, stats, checkpoint,
+                          progress=progress)
+    finally:
+        if profiler is not None:
+            profiler.stop()
     end_time = time.perf_counter()
+    if profiler is not None:
+        profiler.write_folded(profile)
+        profiler.print_summary()
+    print(f"Total Count: {stats['expanded']}")
     if path:
         runtime = end_time - start_time
         minutes, seconds = divmod(runtime, 60)
         print("-" * 30)
         print(f"Runtime: {int(minutes)} minutes and {seconds:.5f} seconds")
-        print("Number of Moves: {}".format(len(path) - 1))
+        print("Number of Moves: {}".format(len(path)))
         print("-" * 30)
-
-        debug_counter = 0
-        for step in path:
-            # print(step)
-            # step.special_print()
-            debug[step] = debug_counter
-            debug_counter += 1
     else:
         print("No solution found.")
 
-    return path,debug
+    return path
 
-def solve_debug(initial_state,debug):
-    # debug
-    # initial_state = LiquidPuzzle("[[], [0, 1, 1], [2, 0, 1], [0, 2, 2]]")
-    # debug = {}
-
-    start_time = time.perf_counter()
-    path = debug_a_star(initial_state,debug)
-    end_time = time.perf_counter()
-    if path:
-        runtime = end_time - start_time
-        minutes, seconds = divmod(runtime, 60)
-        print("-" * 30)
-        print(f"Runtime: {int(minutes)} minutes and {seconds:.5f} seconds")
-        print("Number of Moves: {}".format(len(path) - 1))
-        print("-" * 30)
 
-        debug_counter = 0
-        # for step in path:
-            # print(step)
-            # step.special_print()
-            # debug[step] = debug_counter
-            # debug_counter += 1
-    else:
-        print("No solution found.")
+# Builds a random puzzle without any UI, a solved puzzle scrambled with random reverse moves (like createRandom).
+# The same seed always gives the same puzzle
+def generate_puzzle(tubes_amount, tube_size, colors, moves, seed=None):
+    rng = random.Random(seed)
+    puzzle = LiquidPuzzle("[[]]")
+    if not puzzle.buildComplete(tubes_amount, tube_size, colors):
+        raise ValueError("Invalid puzzle size")
+    done = 0
+    attempts = 0
+    while done < moves and attempts < moves * 100:
+        attempts += 1
+        tube_from = rng.randrange(tubes_amount)
+        tube_to = rng.randrange(tubes_amount)
+        if tube_from != tube_to and puzzle.is_valid_move(tube_from, tube_to, reverse=True):
+            puzzle = puzzle.move(tube_from, tube_to, reverse=True)
+            done += 1
+    return puzzle
 
 
 # UI, Build a random Liquid Puzzle
@@ -730,5 +2495,4 @@ if __name__ == '__main__':
     # initial_state = LiquidPuzzle("[[], [], [], [], [], [], [], [], [], [], [10, 14, 5, 48, 23, 16, 3, 23, 16, 2, 20, 24, 22, 20, 8, 8, 18, 19, 23, 1, 7, 22, 39, 40, 1, 22, 7, 20, 2, 37, 13, 24, 26, 38, 17, 22, 22, 29, 23, 46, 36, 5, 21, 3, 34, 1, 5, 3, 7, 12], [11, 5, 26, 35, 29, 15, 40, 27, 10, 14, 18, 38, 23, 4, 44, 25, 48, 35, 38, 10, 30, 27, 15, 19, 30, 28, 41, 21, 42, 41, 1, 5, 19, 36, 47, 25, 3, 36, 35, 48, 27, 43, 45, 42, 28, 27, 44, 8, 40, 0], [9, 39, 2, 32, 41, 24, 43, 9, 18, 29, 25, 35, 18, 34, 2, 37, 24, 37, 23, 10, 15, 37, 17, 34, 11, 16, 32, 33, 39, 31, 31, 0, 1, 3, 13, 42, 21, 46, 23, 30, 5, 39, 35, 46, 0, 7, 28, 14, 10, 49], [31, 12, 2, 4, 7, 30, 30, 30, 4, 31, 41, 7, 45, 45, 9, 43, 47, 30, 31, 20, 7, 15, 29, 23, 9, 49, 8, 11, 21, 21, 1, 14, 17, 21, 38, 10, 2, 43, 48, 48, 30, 25, 8, 14, 27, 5, 6, 20, 17, 48], [7, 27, 37, 45, 5, 31, 7, 44, 9, 48, 28, 24, 18, 46, 42, 18, 15, 30, 44, 49, 26, 49, 9, 36, 21, 8, 3, 11, 23, 0, 25, 10, 10, 3, 28, 24, 26, 45, 20, 20, 13, 37, 25, 32, 48, 6, 4, 13, 6, 15], [15, 15, 15, 43, 10, 5, 27, 7, 46, 9, 3, 4, 31, 13, 44, 23, 28, 15, 27, 44, 14, 38, 6, 28, 15, 34, 37, 14, 43, 40, 2, 12, 8, 34, 3, 49, 6, 44, 12, 17, 35, 47, 25, 24, 30, 21, 39, 24, 26, 41], [16, 16, 16, 16, 16, 16, 16, 16, 16, 16, 16, 16, 16, 19, 11, 23, 21, 10, 15, 8, 49, 10, 14, 16, 11, 30, 38, 12, 34, 34, 25, 9, 26, 13, 44, 10, 26, 35, 38, 16, 1, 14, 41, 8, 48, 37, 10, 5, 37, 46], [17, 17, 17, 17, 17, 17, 17, 17, 17, 17, 17, 17, 17, 2, 38, 48, 0, 1, 41, 1, 47, 14, 22, 1, 6, 27, 37, 17, 1, 36, 34, 1, 25, 18, 18, 23, 8, 10, 1, 47, 11, 24, 42, 1, 8, 40, 2, 33, 18, 33], [46, 17, 31, 3, 30, 13, 34, 11, 1, 37, 10, 5, 30, 28, 31, 47, 30, 31, 18, 32, 34, 0, 24, 21, 22, 30, 37, 11, 44, 6, 11, 29, 49, 32, 25, 32, 3, 4, 7, 12, 31, 3, 8, 12, 25, 13, 20, 0, 9, 21], [19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 49, 36, 1, 28, 35, 3, 49, 27, 2, 30, 10, 28, 37, 10, 23, 12, 0, 15, 4, 39, 39, 4, 4, 5, 7, 47, 3, 15, 7, 35, 38, 40, 23, 43, 36, 23], [11, 0, 24, 19, 5, 9, 43, 3, 30, 49, 27, 4, 13, 37, 38, 8, 4, 36, 11, 8, 12, 31, 41, 25, 10, 28, 13, 11, 39, 24, 45, 5, 43, 45, 26, 5, 46, 23, 7, 7, 24, 16, 34, 11, 22, 45, 28, 9, 9, 9], [21, 21, 21, 21, 21, 21, 21, 21, 42, 47, 32, 18, 35, 13, 13, 39, 31, 36, 29, 37, 39, 19, 44, 45, 8, 12, 28, 10, 16, 17, 2, 0, 6, 39, 10, 37, 32, 3, 28, 38, 25, 41, 13, 2, 44, 2, 37, 49, 18, 12], [22, 22, 22, 22, 22, 22, 22, 22, 22, 22, 13, 22, 35, 39, 17, 22, 47, 29, 34, 36, 11, 0, 14, 13, 14, 15, 26, 39, 38, 26, 41, 41, 20, 13, 17, 44, 44, 44, 3, 0, 3, 49, 36, 3, 28, 29, 29, 40, 48, 21], [23, 23, 23, 23, 23, 23, 23, 23, 23, 5, 35, 27, 24, 15, 17, 15, 40, 34, 1, 32, 40, 45, 13, 16, 42, 22, 23, 20, 12, 49, 12, 6, 35, 37, 49, 22, 15, 49, 26, 47, 23, 46, 28, 42, 24, 46, 24, 26, 4, 16], [24, 24, 24, 24, 24, 24, 24, 24, 24, 9, 22, 23, 4, 39, 2, 20, 36, 27, 9, 47, 9, 20, 31, 4, 19, 45, 44, 23, 4, 32, 8, 49, 39, 43, 16, 17, 37, 23, 20, 21, 3, 3, 21, 35, 26, 15, 20, 2, 5, 38], [1, 0, 40, 13, 30, 49, 28, 6, 36, 37, 22, 29, 9, 14, 36, 32, 30, 39, 25, 19, 37, 45, 40, 17, 24, 7, 26, 1, 24, 1, 1, 7, 4, 17, 21, 4, 11, 45, 23, 1, 10, 43, 14, 5, 4, 32, 33, 42, 44, 26], [15, 12, 34, 3, 29, 23, 30, 47, 40, 22, 4, 8, 29, 34, 1, 29, 29, 13, 25, 28, 14, 44, 10, 16, 2, 35, 40, 16, 8, 24, 10, 42, 12, 41, 11, 2, 25, 46, 22, 22, 25, 6, 33, 45, 18, 20, 9, 27, 32, 26], [48, 5, 38, 21, 37, 17, 21, 32, 41, 26, 46, 45, 16, 1, 46, 4, 49, 3, 39, 15, 44, 12, 34, 14, 41, 28, 32, 44, 4, 48, 24, 14, 13, 47, 10, 34, 35, 4, 28, 15, 24, 24, 48, 45, 31, 28, 32, 24, 10, 44], [28, 28, 28, 28, 28, 28, 34, 37, 22, 27, 38, 27, 49, 23, 33, 33, 6, 15, 37, 44, 5, 45, 21, 31, 7, 21, 12, 44, 26, 44, 4, 43, 49, 30, 5, 13, 12, 31, 21, 44, 5, 14, 7, 46, 6, 31, 0, 1, 18, 19], [29, 29, 29, 29, 29, 29, 29, 29, 29, 29, 22, 42, 46, 13, 14, 40, 38, 47, 33, 38, 14, 14, 35, 19, 47, 12, 25, 13, 15, 42, 15, 28, 31, 31, 14, 24, 38, 28, 39, 9, 43, 8, 43, 0, 49, 24, 46, 3, 3, 39], [30, 30, 30, 30, 30, 5, 2, 39, 9, 38, 34, 1, 19, 40, 34, 1, 7, 5, 18, 10, 46, 30, 15, 27, 45, 25, 39, 32, 20, 46, 21, 32, 2, 18, 19, 43, 22, 46, 11, 14, 11, 40, 14, 41, 3, 3, 3, 11, 31, 9], [31, 31, 11, 43, 32, 38, 10, 20, 36, 45, 32, 32, 13, 11, 6, 38, 21, 11, 8, 15, 6, 12, 0, 18, 34, 9, 9, 11, 14, 31, 0, 39, 2, 12, 48, 29, 33, 10, 28, 37, 43, 40, 16, 26, 13, 41, 0, 24, 49, 18], [32, 32, 32, 32, 32, 32, 32, 32, 32, 6, 41, 42, 46, 27, 46, 7, 44, 25, 28, 40, 8, 32, 26, 40, 6, 20, 47, 48, 27, 18, 48, 5, 35, 4, 46, 4, 7, 14, 0, 4, 45, 39, 15, 13, 19, 44, 9, 9, 9, 9], [33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 45, 17, 35, 37, 9, 24, 47, 25, 10, 41, 22, 18, 7, 34, 42, 49, 37, 35, 35, 3, 6, 39, 44, 32, 10, 49, 26], [34, 34, 34, 34, 35, 35, 41, 39, 29, 25, 8, 34, 43, 13, 1, 6, 47, 39, 47, 42, 12, 0, 3, 43, 17, 1, 31, 15, 29, 12, 22, 30, 13, 46, 8, 25, 19, 45, 12, 35, 25, 36, 22, 23, 41, 15, 2, 26, 0, 43], [35, 35, 35, 35, 35, 35, 35, 35, 46, 3, 25, 27, 15, 38, 0, 34, 29, 30, 7, 3, 30, 31, 45, 13, 40, 19, 8, 18, 25, 21, 36, 23, 23, 46, 31, 31, 20, 7, 31, 20, 21, 12, 11, 21, 9, 13, 21, 44, 0, 6], [36, 36, 36, 36, 36, 36, 36, 36, 36, 36, 36, 36, 23, 34, 1, 11, 38, 8, 30, 44, 40, 15, 5, 26, 3, 6, 21, 26, 3, 25, 20, 7, 31, 0, 41, 9, 3, 25, 20, 12, 4, 36, 16, 14, 43, 7, 27, 47, 28, 20], [45, 18, 27, 5, 41, 25, 8, 43, 13, 37, 41, 29, 14, 4, 28, 44, 43, 34, 27, 13, 23, 2, 44, 25, 45, 37, 2, 11, 47, 0, 37, 47, 27, 24, 27, 2, 20, 36, 18, 14, 25, 22, 30, 6, 22, 7, 30, 48, 10, 29], [38, 38, 38, 38, 38, 38, 2, 48, 21, 0, 37, 38, 47, 36, 42, 22, 41, 43, 3, 16, 34, 20, 44, 37, 45, 18, 43, 40, 4, 21, 11, 17, 34, 13, 39, 0, 48, 34, 19, 21, 25, 8, 4, 11, 12, 5, 14, 6, 28, 6], [39, 39, 39, 39, 39, 39, 6, 30, 41, 35, 36, 13, 3, 44, 37, 21, 30, 26, 49, 10, 33, 43, 42, 47, 46, 39, 6, 32, 35, 6, 38, 24, 40, 43, 18, 24, 22, 26, 46, 37, 2, 4, 47, 8, 16, 25, 49, 25, 9, 47], [40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 11, 35, 36, 40, 23, 28, 47, 48, 31, 28, 20, 35, 29, 23, 27, 48, 17, 30, 48, 49, 41, 39, 20, 39, 27, 24, 19, 18, 12, 47, 33, 8, 8, 18, 2, 47], [49, 32, 5, 39, 43, 7, 27, 1, 34, 34, 18, 31, 26, 11, 27, 8, 25, 20, 20, 2, 13, 27, 8, 5, 37, 15, 30, 19, 9, 42, 23, 26, 10, 22, 5, 5, 28, 6, 33, 14, 27, 36, 44, 45, 39, 30, 39, 29, 2, 13], [42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 42, 18, 8, 29, 8, 31, 9, 20, 28, 9, 27, 17, 38, 39, 19, 48, 9, 7, 18, 37, 14, 49, 17, 41, 47, 35, 0, 24, 5], [43, 43, 43, 43, 43, 43, 43, 43, 43, 3, 27, 14, 29, 18, 43, 1, 14, 39, 33, 44, 31, 19, 46, 44, 40, 7, 16, 43, 24, 34, 11, 9, 18, 17, 17, 6, 21, 25, 9, 45, 26, 32, 31, 23, 33, 21, 11, 4, 0, 0], [26, 45, 32, 5, 49, 33, 30, 1, 9, 4, 1, 40, 5, 14, 39, 28, 11, 17, 38, 2, 36, 22, 37, 18, 16, 13, 47, 2, 34, 15, 1, 28, 14, 40, 10, 16, 17, 10, 27, 47, 12, 11, 8, 31, 26, 11, 26, 0, 6, 3], [45, 45, 45, 45, 45, 45, 45, 45, 45, 45, 45, 18, 35, 20, 17, 45, 37, 18, 43, 10, 40, 22, 44, 18, 16, 4, 21, 19, 44, 41, 1, 47, 27, 13, 35, 37, 0, 28, 16, 15, 3, 15, 4, 26, 17, 29, 47, 0, 4, 45], [46, 46, 46, 46, 46, 46, 46, 46, 46, 46, 46, 46, 46, 39, 26, 3, 48, 24, 24, 47, 31, 18, 31, 22, 11, 8, 41, 19, 25, 36, 49, 7, 1, 7, 22, 5, 41, 23, 26, 24, 29, 41, 20, 1, 6, 26, 38, 28, 18, 19], [30, 30, 49, 12, 48, 12, 31, 41, 38, 1, 32, 10, 32, 9, 10, 20, 4, 3, 18, 49, 1, 26, 14, 36, 31, 3, 40, 2, 42, 35, 7, 20, 41, 47, 3, 29, 36, 14, 5, 45, 12, 1, 26, 29, 11, 5, 35, 16, 12, 45], [48, 48, 48, 48, 48, 48, 48, 48, 48, 48, 48, 48, 12, 27, 36, 5, 32, 31, 12, 47, 7, 27, 37, 38, 5, 7, 14, 48, 45, 16, 32, 20, 8, 6, 10, 13, 18, 47, 38, 23, 18, 15, 28, 37, 9, 4, 43, 34, 25, 39], [49, 49, 49, 49, 49, 49, 49, 49, 49, 49, 49, 42, 33, 33, 19, 44, 43, 15, 31, 14, 8, 24, 41, 0, 25, 37, 1, 2, 4, 16, 2, 28, 27, 25, 18, 33, 6, 46, 49, 12, 27, 15, 6, 29, 5, 24, 7, 35, 0, 35], [47, 29, 19, 11, 45, 14, 30, 4, 4, 25, 36, 19, 0, 15, 15, 5, 48, 38, 28, 35, 24, 34, 1, 16, 0, 39, 13, 17, 32, 44, 6, 12, 21, 11, 40, 14, 36, 22, 27, 29, 10, 47, 3, 5, 15, 10, 18, 7, 25, 29], [19, 8, 35, 44, 33, 15, 19, 38, 20, 49, 22, 26, 0, 2, 2, 44, 18, 48, 33, 45, 27, 11, 2, 10, 41, 13, 32, 6, 43, 11, 6, 25, 15, 27, 14, 32, 49, 21, 6, 39, 12, 48, 20, 41, 36, 7, 33, 47, 9, 20], [6, 38, 46, 29, 48, 28, 45, 12, 47, 29, 36, 12, 2, 28, 15, 36, 2, 4, 38, 4, 37, 13, 28, 33, 18, 43, 20, 47, 41, 14, 49, 37, 0, 27, 10, 25, 17, 31, 4, 18, 7, 20, 40, 34, 33, 7, 7, 25, 45, 9], [15, 11, 22, 49, 26, 41, 2, 20, 26, 25, 20, 23, 35, 17, 20, 32, 47, 16, 6, 38, 18, 11, 25, 19, 40, 6, 19, 31, 25, 11, 7, 8, 38, 5, 27, 36, 33, 47, 8, 43, 37, 34, 19, 23, 2, 38, 40, 32, 33, 0], [27, 31, 20, 44, 21, 25, 26, 27, 13, 32, 12, 42, 38, 32, 4, 10, 5, 26, 47, 0, 41, 44, 34, 44, 0, 23, 8, 24, 14, 21, 1, 48, 12, 46, 41, 42, 24, 29, 46, 13, 13, 42, 46, 1, 48, 22, 9, 9, 9, 9], [31, 34, 4, 22, 2, 34, 39, 10, 14, 7, 22, 39, 46, 26, 34, 28, 46, 31, 44, 35, 44, 26, 10, 7, 46, 17, 13, 37, 26, 43, 41, 41, 38, 30, 41, 33, 26, 38, 47, 43, 8, 12, 6, 1, 30, 0, 33, 18, 6, 10], [31, 41, 36, 19, 30, 30, 4, 8, 41, 48, 32, 15, 22, 15, 13, 2, 8, 9, 1, 20, 27, 34, 47, 35, 42, 16, 23, 37, 11, 40, 16, 18, 16, 30, 17, 0, 20, 10, 2, 44, 13, 16, 0, 17, 0, 38, 28, 26, 1, 26], [1, 21, 8, 7, 38, 29, 6, 41, 16, 27, 12, 14, 4, 20, 35, 12, 12, 4, 48, 25, 7, 19, 37, 5, 36, 17, 5, 16, 29, 0, 40, 3, 8, 3, 38, 6, 31, 20, 5, 5, 37, 7, 7, 9, 18, 11, 2, 10, 44, 20], [2, 16, 14, 6, 11, 11, 20, 13, 30, 32, 21, 29, 3, 46, 44, 15, 42, 9, 19, 31, 17, 45, 47, 23, 17, 42, 2, 48, 19, 37, 10, 26, 2, 41, 21, 27, 6, 11, 4, 39, 0, 3, 3, 43, 29, 42, 8, 29, 12, 8], [30, 42, 34, 43, 43, 17, 41, 2, 7, 47, 30, 48, 19, 16, 32, 41, 36, 23, 49, 9, 6, 48, 16, 34, 0, 2, 5, 34, 40, 13, 41, 22, 34, 1, 14, 0, 16, 6, 36, 12, 39, 21, 12, 14, 8, 35, 15, 12, 27, 6]]")
     # result = solve(initial_state)
     # arr = initial_state.get_neighbors()
-    # solve_debug(initial_state,result[1])
     menu()
@@ -0,0 +1,209 @@
+import array
+import multiprocessing
+import os
+import queue
+
+from main import OpenSet, Plan, TIE_BREAKERS, incremental_heuristic, move_typecode
+
+
+# Hash Distributed A-star (HDA*) over several processes.
+# Every worker owns the states whose hash falls in its partition, it keeps the open set, g scores, node records and
+# closed set of those states only. A node record is the move that reached a state and the number of the record of the
+# state it was poured from (like the records of a_star), the records of a worker are numbered
+# record index * workers + worker so a parent kept by another worker is a single number too.
+# Expanding a state sends every neighbor (with its move and the record of its parent) to the worker that owns it, the
+# messages are sent in batches once per round, and in every round each worker sends exactly one batch (maybe empty) to
+# every other worker so all the messages of a round are delivered before the round ends.
+# After each round the workers report the smallest f in their open set and the best goal they expanded. In the next
+# round a worker only expands the states whose f is not bigger than the smallest f of all the workers (the states a
+# serial a_star would expand next), so more workers do not mean expanding worse states while the better ones wait in
+# the open set of another worker. The search stops once the f of the best goal is not bigger than every f left in the
+# open sets - the same rule as a_star, which stops when the goal is the best state in the open set (with an admissible
+# heuristic this is the optimal solution).
+# The workers are forked so they share the hash seed of the main process, this is what makes the partition of a state
+# the same in every process, so the parallel search runs on Linux (or any system with fork).
+
+# The most states every worker expands in a round
+BATCH_SIZE = 256
+
+
+# The worker that owns a state
+def owner(state, workers):
+    return hash(state) % workers
+
+
+def worker(index, workers, initial_state, heuristic, tie_break, batch_size, inboxes, reports, commands):
+    priority_key = TIE_BREAKERS[tie_break]
+    open_set = OpenSet()
+    g_score = {}
+    # The number of the record that reached every state (none for the initial state), the parent number and the move
+    # of every record of this worker
+    came_from = {}
+    parents = array.array('q')
+    moves = array.array(move_typecode(initial_state))
+    h_data = {}
+    closed_set = set()
+    inserted = 0
+    best_goal = None
+    best_goal_f = float('inf')
+    incumbent = float('inf')
+    # The smallest f of all the workers, the first round starts from the f of the initial state
+    data = heuristic.start(initial_state)
+    bound = heuristic.value(data)
+    expanded = 0
+    generated = 0
+
+    # Adds a state (or a better path to it) to this worker, parent is the number of the record of the state it was
+    # poured from with move. Returns nothing if the state is not better
+    def add(state, g, parent, move, data):
+        nonlocal inserted
+        if state in g_score and g >= g_score[state]:
+            return
+        if state in closed_set:
+            # A better path to a state that was already expanded, it has to be expanded again
+            closed_set.remove(state)
+        g_score[state] = g
+        if move is not None:
+            # The open set keeps the object of the new path, so the moves of the records replay exactly
+            came_from[state] = len(parents) * workers + index
+            parents.append(parent)
+            moves.extend(move)
+        h_data[state] = data
+        h_value = heuristic.value(data)
+        inserted += 1
+        open_set.push(state, priority_key(g + h_value, g, h_value, inserted))
+
+    if owner(initial_state, workers) == index:
+        add(initial_state, 0, -1, None, data)
+
+    while True:
+        outboxes = [[] for _ in range(workers)]
+        done = 0
+        while open_set and done < batch_size:
+            priority = open_set.peek()[0]
+            if priority[0] >= min(incumbent, best_goal_f) or priority[0] > bound:
+                break
+            current = open_set.pop()[1]
+            current_data = h_data.pop(current)
+            done += 1
+            record = came_from.get(current, -1)
+            if current.is_goal():
+                best_goal, best_goal_f = record, priority[0]
+                continue
+            closed_set.add(current)
+
+            g = g_score[current] + 1
+            tubes = current.tubes
+            for move in current.get_moves():
+                tube_from, tube_to, amount = move
+                neighbor = current.pour(tube_from, tube_to, amount)
+                generated += 1
+                data = heuristic.after_pour(current_data, neighbor, tube_from, tube_to, tubes[tube_from],
+                                            tubes[tube_to])
+                target = owner(neighbor, workers)
+                if target == index:
+                    add(neighbor, g, record, move, data)
+                else:
+                    outboxes[target].append((neighbor, record, move, g, data))
+        expanded += done
+
+        for target in range(workers):
+            if target != index:
+                inboxes[target].put(outboxes[target])
+        for _ in range(workers - 1):
+            for neighbor, parent, move, g, data in inboxes[index].get():
+                add(neighbor, g, parent, move, data)
+
+        min_f = open_set.peek()[0][0] if open_set else float('inf')
+        reports.put((index, min_f, best_goal_f, best_goal, expanded, generated))
+
+        # Wait for the coordinator, it either starts a new round or asks for node records before stopping
+        while True:
+            command = commands[index].get()
+            if command[0] == 'round':
+                incumbent, bound = command[1], command[2]
+                break
+            if command[0] == 'record':
+                record = command[1]
+                reports.put((parents[record], tuple(moves[3 * record:3 * record + 3])))
+            elif command[0] == 'stop':
+                return
+
+
+# Waits for a message from the workers, fails if one of them died instead of blocking forever
+def receive(messages, processes):
+    while True:
+        try:
+            return messages.get(timeout=1)
+        except queue.Empty:
+            for process in processes:
+                if process.exitcode not in (None, 0):
+                    raise RuntimeError(f"Worker {process.name} stopped with exit code {process.exitcode}")
+
+
+# Parallel A star, returns the Plan from the initial state to a goal like a_star or None if there is no solution.
+# workers is the amount of processes (all the cores by default) and batch_size the most states a worker expands before
+# exchanging neighbors with the others. stats, when given, is a dict that gets the amount of expanded and
+# generated states of all the workers, and progress a SearchProgress that gets a report after every round
+def parallel_a_star(initial_state, workers=None, heuristic=None, tie_break='fifo', batch_size=BATCH_SIZE, stats=None,
+                    progress=None):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    heuristic = incremental_heuristic(heuristic)
+    context = multiprocessing.get_context('fork')
+    inboxes = [context.Queue() for _ in range(workers)]
+    commands = [context.Queue() for _ in range(workers)]
+    reports = context.Queue()
+    processes = [context.Process(target=worker, name=f"hda-{index}", daemon=True,
+                                 args=(index, workers, initial_state, heuristic, tie_break, batch_size, inboxes,
+                                       reports, commands))
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+    if progress is not None:
+        # The heuristic runs in the workers, so it is not timed
+        progress.start('parallel_a_star')
+
+    try:
+        best_goal = None
+        best_goal_f = float('inf')
+        while True:
+            min_f = float('inf')
+            expanded = generated = 0
+            for _ in range(workers):
+                index, worker_min_f, goal_f, goal, worker_expanded, worker_generated = receive(reports, processes)
+                min_f = min(min_f, worker_min_f)
+                expanded += worker_expanded
+                generated += worker_generated
+                if goal_f < best_goal_f:
+                    best_goal, best_goal_f = goal, goal_f
+            if best_goal_f <= min_f or min_f == float('inf'):
+                if progress is not None:
+                    progress.report(expanded, generated, True, best_f=min_f, solution=best_goal_f)
+                break
+            if progress is not None:
+                progress.report(expanded, generated, best_f=min_f, solution=best_goal_f)
+            for index in range(workers):
+                commands[index].put(('round', best_goal_f, min_f))
+
+        if stats is not None:
+            stats.update(expanded=expanded, generated=generated)
+        if best_goal is None:
+            return None
+
+        # Follow the node records from the goal back to the initial state, every record is asked from the worker that
+        # keeps it
+        path = []
+        record = best_goal
+        while record >= 0:
+            commands[record % workers].put(('record', record // workers))
+            record, move = receive(reports, processes)
+            path.append(move)
+        return Plan(initial_state, path[::-1])
+    finally:
+        for index in range(workers):
+            commands[index].put(('stop',))
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
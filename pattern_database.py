@@ -0,0 +1,292 @@
+import argparse
+import collections
+import mmap
+import os
+import struct
+import sys
+import time
+
+from main import IncrementalHeuristic, top_streak
+from puzzle_io import read_puzzle
+
+# Additive pattern database heuristic. The colors of the puzzle are split into groups of group_size colors, and every
+# group has a table of the exact distances of an abstract puzzle: the colors of the group keep their own symbol and
+# all the other colors become a single symbol OTHER. A pour of a color of the group costs one move and a pour of OTHER
+# costs nothing, so every move of the real puzzle is counted by the table of the group of its color only and the sum of
+# the tables never overestimates the real distance.
+# A pour of OTHER may move any part of the OTHER units at the top of a tube (they can be of several real colors), every
+# real pour is a pour of the abstract puzzle, and a real goal is an abstract goal.
+# The tables are built by a breadth first search backwards from the goal, pouring back (0-1 BFS, the pours of OTHER
+# cost nothing), and written as files of fixed width records sorted in byte order (the abstract state in canonical
+# form and its distance), read through mmap with a binary search. The colors are interchangeable, so every group of
+# colors with the same amounts of units uses the same table, the tables are kept in DIRECTORY and a table is built
+# only the first time its dimensions are used:
+#   python pattern_database.py "[[1,2,1],[2,1,2],[]]" --group-size 2
+
+PAD = 0xFF
+OTHER = 0xFE
+MAGIC = b'LQPD'
+VERSION = 1
+# magic, version, tubes, tube size, record count
+HEADER = struct.Struct('<4sHHHQ')
+# The distances are kept in a byte, a bigger distance is stored as MAX_DISTANCE (still a lower bound)
+MAX_DISTANCE = 0xFF
+GROUP_SIZE = 2
+# A table with more abstract states is not built, the groups get smaller instead
+MAX_STATES = 1 << 21
+DIRECTORY = os.environ.get('LIQUID_PDB_DIRECTORY',
+                           os.path.join(os.path.expanduser("~"), ".cache", "liquid_puzzle", "pattern_database"))
+
+
+# The record of an abstract state, every tube padded to the tube size and the padded tubes sorted
+def encode(tubes, tube_size):
+    pad = bytes([PAD])
+    return b''.join(sorted(tube + pad * (tube_size - len(tube)) for tube in tubes))
+
+
+def decode(record, tube_size):
+    return [record[index:index + tube_size].rstrip(bytes([PAD])) for index in range(0, len(record), tube_size)]
+
+
+# The abstract states a single pour away from the given one, the pours that lead to it, as (record, cost).
+# A pour of amount units of color from a onto b gives b = color * amount + old b, where old b is empty or starts with
+# the same color. For a color of the group the amount is the whole streak at the top of a, the top of a (after the pour)
+# is not that color
+def predecessors(tubes, tube_size):
+    for index_b, tube_b in enumerate(tubes):
+        if not tube_b:
+            continue
+        color = tube_b[0]
+        streak = top_streak(tube_b)
+        for amount in range(1, streak + 1):
+            rest = tube_b[amount:]
+            if amount == streak and rest:
+                continue
+            poured = tube_b[:amount]
+            tried = set()
+            for index_a, tube_a in enumerate(tubes):
+                if index_a == index_b or len(tube_a) + amount > tube_size or tube_a in tried:
+                    continue
+                tried.add(tube_a)
+                if color != OTHER and tube_a and tube_a[0] == color:
+                    continue
+                new_tubes = list(tubes)
+                new_tubes[index_b] = rest
+                new_tubes[index_a] = poured + tube_a
+                yield encode(new_tubes, tube_size), 0 if color == OTHER else 1
+
+
+# The distances to the goal of every abstract state that can reach it, {record: distance}, or None when there are more
+# than max_states. counts is the amount of units of every color of the group (the symbols 0, 1, ...) and then of OTHER
+def retrograde_bfs(tubes_amount, tube_size, counts, max_states=MAX_STATES):
+    symbols = list(range(len(counts) - 1)) + [OTHER]
+    goal = []
+    for symbol, count in zip(symbols, counts):
+        if count % tube_size:
+            return {}
+        goal += [bytes([symbol]) * tube_size] * (count // tube_size)
+    if len(goal) > tubes_amount:
+        return {}
+    goal += [b''] * (tubes_amount - len(goal))
+
+    start = encode(goal, tube_size)
+    distances = {start: 0}
+    queue = collections.deque([(0, start)])
+    while queue:
+        distance, record = queue.popleft()
+        # A state found again with a smaller distance is in the queue twice
+        if distances[record] < distance:
+            continue
+        for previous, cost in predecessors(decode(record, tube_size), tube_size):
+            old = distances.get(previous)
+            if old is None or distance + cost < old:
+                distances[previous] = distance + cost
+                if cost:
+                    queue.append((distance + cost, previous))
+                else:
+                    queue.appendleft((distance, previous))
+        if len(distances) > max_states:
+            return None
+    return distances
+
+
+class PatternTable:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        magic, version, self.tubes_amount, self.tube_size, self.length = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a pattern database")
+        self.key_size = self.tubes_amount * self.tube_size
+        self.record_size = self.key_size + 1
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.length else None
+
+    def __len__(self):
+        return self.length
+
+    # The distance of the record of an abstract state, None when it can not reach the goal
+    def lookup(self, key):
+        record_map = self.map
+        record_size = self.record_size
+        key_size = self.key_size
+        low, high = 0, self.length
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * record_size
+            if record_map[offset:offset + key_size] < key:
+                low = middle + 1
+            else:
+                high = middle
+        offset = HEADER.size + low * record_size
+        if low < self.length and record_map[offset:offset + key_size] == key:
+            return record_map[offset + key_size]
+        return None
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+# Builds the table of the given dimensions into path, returns False when it has more than max_states states
+def build_table(path, tubes_amount, tube_size, counts, max_states=MAX_STATES):
+    distances = retrograde_bfs(tubes_amount, tube_size, counts, max_states)
+    if distances is None:
+        return False
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, tubes_amount, tube_size, len(distances)))
+        for record in sorted(distances):
+            file.write(record + bytes([min(distances[record], MAX_DISTANCE)]))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+    return True
+
+
+# The tables of a set of puzzle dimensions, opened (or built) the first time they are needed
+class PatternDatabase:
+    def __init__(self, directory=DIRECTORY, max_states=MAX_STATES):
+        self.directory = directory
+        self.max_states = max_states
+        self.tables = {}
+
+    def table_path(self, tubes_amount, tube_size, counts):
+        return os.path.join(self.directory, f"pdb-{tubes_amount}x{tube_size}-{'-'.join(map(str, counts))}.bin")
+
+    # The table of the dimensions, None when it would be too big. A table that was too big is remembered with an
+    # empty marker file so it is not tried again
+    def table(self, tubes_amount, tube_size, counts):
+        key = (tubes_amount, tube_size, counts)
+        if key not in self.tables:
+            path = self.table_path(tubes_amount, tube_size, counts)
+            marker = f"{path}.over-{self.max_states}"
+            if not os.path.exists(path) and not os.path.exists(marker):
+                if not build_table(path, tubes_amount, tube_size, counts, self.max_states):
+                    os.makedirs(self.directory, exist_ok=True)
+                    open(marker, 'w').close()
+            self.tables[key] = PatternTable(path) if os.path.exists(path) else None
+        return self.tables[key]
+
+    # Splits the colors of the puzzle into groups of at most group_size colors with a table each, smaller groups are
+    # used when a table would be too big. Returns a list of (translation, table), the translation maps the colors of
+    # the puzzle to the symbols of the table
+    def groups(self, state, group_size=GROUP_SIZE):
+        amounts = collections.Counter(color for tube in state.tubes for color in tube)
+        colors = sorted(amounts, key=lambda color: (amounts[color], color))
+        total = sum(amounts.values())
+        for size in range(min(group_size, len(colors)), 0, -1):
+            groups = []
+            for first in range(0, len(colors), size):
+                group = colors[first:first + size]
+                counts = tuple(amounts[color] for color in group) + (total - sum(amounts[color] for color in group),)
+                table = self.table(len(state.tubes), state.tube_size, counts)
+                if table is None:
+                    break
+                symbols = {color: symbol for symbol, color in enumerate(group)}
+                groups.append((Translation(symbols), table))
+            else:
+                return groups
+        raise ValueError(f"The pattern database of a {len(state.tubes)}x{state.tube_size} puzzle with "
+                         f"{len(colors)} colors has more than {self.max_states} states even for single colors")
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables.clear()
+
+
+# Maps the tubes of a puzzle to the tubes of the abstract puzzle of a group of colors
+class Translation:
+    def __init__(self, symbols):
+        self.symbols = symbols
+        # packed tubes are translated with bytes.translate
+        self.table = bytes(symbols.get(color, OTHER) for color in range(256))
+
+    def __call__(self, tube):
+        if isinstance(tube, bytes):
+            return tube.translate(self.table)
+        symbols = self.symbols
+        return bytes(symbols.get(color, OTHER) for color in tube)
+
+
+# The pattern database heuristic, the sum of the distances of the abstract puzzles of every group of colors. The
+# tables are loaded the first time a puzzle of their dimensions is scored
+class PatternDatabaseHeuristic(IncrementalHeuristic):
+    def __init__(self, group_size=GROUP_SIZE, directory=DIRECTORY, max_states=MAX_STATES, name='pattern_database'):
+        super().__init__(self.start, name)
+        self.group_size = group_size
+        self.database = PatternDatabase(directory, max_states)
+        self.dimensions = {}
+        self.values = {}
+
+    def start(self, state):
+        colors = frozenset(color for tube in state.tubes for color in tube)
+        key = (len(state.tubes), state.tube_size, colors)
+        groups = self.dimensions.get(key)
+        if groups is None:
+            groups = self.dimensions[key] = self.database.groups(state, self.group_size)
+        tube_size = state.tube_size
+        value = 0
+        for translate, table in groups:
+            record = encode([translate(tube) for tube in state.tubes], tube_size)
+            distance = self.values.get((table, record))
+            if distance is None:
+                if len(self.values) >= self.cache_limit:
+                    self.values.clear()
+                # A solvable state always has an abstract state in the table
+                distance = self.values[(table, record)] = table.lookup(record) or 0
+            value += distance
+        return value
+
+    def after_pour(self, data, state, tube_from, tube_to, old_from, old_to):
+        return self.start(state)
+
+
+heuristic = PatternDatabaseHeuristic()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Build the pattern database tables of a puzzle and score it")
+    parser.add_argument('puzzle', help="the puzzle, for example \"[[1,2,1],[2,1,2],[]]\", a file holding it or - for "
+                                       "stdin")
+    parser.add_argument('--group-size', type=int, default=GROUP_SIZE, help="colors per table")
+    parser.add_argument('--directory', default=DIRECTORY, help="where the tables are kept")
+    parser.add_argument('--max-states', type=int, default=MAX_STATES, help="the biggest table built")
+    args = parser.parse_args(arguments)
+
+    database = PatternDatabaseHeuristic(args.group_size, args.directory, args.max_states)
+    start_time = time.perf_counter()
+    try:
+        value = database.start(read_puzzle(args.puzzle, strict=True))
+    except ValueError as error:
+        parser.error(str(error))
+    print(f"Runtime: {time.perf_counter() - start_time:.5f} seconds")
+    for translate, table in database.dimensions[next(iter(database.dimensions))]:
+        print(f"Colors {sorted(translate.symbols)}: {len(table)} states")
+    print(f"Heuristic: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+from main import a_star, get_heuristic, heuristic_names, ida_star
+from puzzle_io import PuzzleError, read_puzzle
+
+# Portfolio solver, races several configurations (algorithm and heuristic) on the same puzzle, every one in its own
+# process. The first configuration to find a solution wins and the others are stopped. Every race can be logged as a
+# JSON line (puzzle size, winner and runtimes), the log is then used to learn which configuration wins for every
+# puzzle size, and a later race starts the preferred configurations first (or runs only the preferred one):
+#   python portfolio.py "[[1,2,1],[2,1,2],[]]" --log portfolio.jsonl
+#   python portfolio.py "[[1,2,1],[2,1,2],[]]" --log portfolio.jsonl --learned
+
+# A configuration is written as "algorithm:heuristic", the heuristic is any name get_heuristic knows (custom_heuristic
+# by default)
+ALGORITHMS = {
+    'a_star': a_star,
+    'ida_star': ida_star,
+}
+
+DEFAULT_CONFIGURATIONS = [
+    'a_star:custom_heuristic',
+    'a_star:heuristic_second',
+    'ida_star:custom_heuristic',
+    'ida_star:heuristic_fourth',
+]
+
+
+def parse_configuration(configuration):
+    algorithm, _, heuristic = configuration.partition(':')
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown algorithm {algorithm} in {configuration}, known algorithms: {', '.join(ALGORITHMS)}")
+    get_heuristic(heuristic or 'custom_heuristic')
+    return algorithm, heuristic or None
+
+
+# The key of the puzzle size in the log and the learned preferences
+def size_key(puzzle):
+    return f"{len(puzzle.tubes)}x{puzzle.tube_size}x{puzzle.colors}"
+
+
+def run_configuration(configuration, initial_state, results):
+    algorithm, heuristic = parse_configuration(configuration)
+    stats = {}
+    start_time = time.perf_counter()
+    path = ALGORITHMS[algorithm](initial_state, heuristic=heuristic, stats=stats)
+    results.put((configuration, path, time.perf_counter() - start_time, stats))
+
+
+# Reads a race log and returns the preferred configurations of every puzzle size, {size: [configurations]} with the
+# configuration that won the most races (and then the fastest on average) first
+def learn_preferences(log_path):
+    wins = {}
+    if not os.path.exists(log_path):
+        return {}
+    with open(log_path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            race = json.loads(line)
+            if race['winner'] is None:
+                continue
+            count, total = wins.setdefault(race['size'], {}).get(race['winner'], (0, 0.0))
+            wins[race['size']][race['winner']] = (count + 1, total + race['runtime'])
+    return {size: sorted(configurations, key=lambda name: (-configurations[name][0],
+                                                          configurations[name][1] / configurations[name][0]))
+            for size, configurations in wins.items()}
+
+
+# Orders the configurations by the learned preferences of the size of the puzzle, the unknown ones keep their order
+def order_configurations(initial_state, configurations, preferences):
+    preferred = preferences.get(size_key(initial_state), [])
+    return sorted(configurations, key=lambda name: preferred.index(name) if name in preferred else len(preferred))
+
+
+# Races the configurations on the puzzle, returns (winning configuration, path, runtime) or (None, None, runtime) when
+# no configuration found a solution in the time limit. At most workers configurations run at the same time (all of
+# them by default), the next one starts when one of them gives up. The race is appended to log_path when given
+def race(initial_state, configurations=None, workers=None, time_limit=None, preferences=None, log_path=None):
+    if configurations is None:
+        configurations = DEFAULT_CONFIGURATIONS
+    for configuration in configurations:
+        parse_configuration(configuration)
+    if preferences:
+        configurations = order_configurations(initial_state, configurations, preferences)
+    if workers is None:
+        workers = len(configurations)
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    waiting = list(configurations)
+    running = {}
+    finished = {}
+    winner, path = None, None
+    start_time = time.perf_counter()
+    try:
+        while waiting or running:
+            while waiting and len(running) < workers:
+                configuration = waiting.pop(0)
+                process = context.Process(target=run_configuration, name=configuration, daemon=True,
+                                          args=(configuration, initial_state, results))
+                process.start()
+                running[configuration] = process
+            timeout = 0.5
+            if time_limit is not None:
+                timeout = min(timeout, time_limit - (time.perf_counter() - start_time))
+                if timeout <= 0:
+                    break
+            try:
+                reports = [results.get(timeout=timeout)]
+            except queue.Empty:
+                # A configuration that died (for example out of memory) gives up its place. The exit codes are read
+                # before the queue is drained, so a configuration that put its result just before exiting is not
+                # taken for a failed one
+                exited = {configuration: process.exitcode for configuration, process in running.items()
+                          if process.exitcode is not None}
+                reports = []
+                while True:
+                    try:
+                        reports.append(results.get_nowait())
+                    except queue.Empty:
+                        break
+                reported = {report[0] for report in reports}
+                for configuration, exitcode in exited.items():
+                    if configuration not in reported:
+                        del running[configuration]
+                        finished[configuration] = {'status': 'failed', 'exitcode': exitcode}
+            for configuration, found, runtime, stats in reports:
+                process = running.pop(configuration, None)
+                if process is not None:
+                    process.join()
+                finished[configuration] = dict(stats, status='solved' if found else 'unsolvable',
+                                               runtime=round(runtime, 6))
+                if found:
+                    winner, path = configuration, found
+                    break
+            if winner is not None:
+                break
+    finally:
+        for process in running.values():
+            process.terminate()
+        for process in running.values():
+            process.join()
+    runtime = time.perf_counter() - start_time
+
+    if log_path is not None:
+        line = {'size': size_key(initial_state), 'puzzle': str([list(tube) for tube in initial_state.tubes]),
+                'winner': winner, 'runtime': round(runtime, 6), 'moves': len(path) if path else None,
+                'cancelled': sorted(running), 'finished': finished}
+        with open(log_path, 'a') as file:
+            file.write(json.dumps(line) + "\n")
+    return winner, path, runtime
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Race several solver configurations on a liquid puzzle")
+    parser.add_argument('puzzle', help="the puzzle, for example \"[[1,2,1],[2,1,2],[]]\", a file holding it or - for "
+                                       "stdin")
+    parser.add_argument('--configurations', nargs='+', default=DEFAULT_CONFIGURATIONS,
+                        help="algorithm:heuristic, algorithms: {}, heuristics: {}".format(
+                            ', '.join(ALGORITHMS), ', '.join(heuristic_names())))
+    parser.add_argument('--workers', type=int, default=None, help="configurations running at the same time")
+    parser.add_argument('--time-limit', type=float, default=None, help="seconds for the whole race")
+    parser.add_argument('--log', default=None, help="JSON lines file the race is appended to")
+    parser.add_argument('--learned', action='store_true',
+                        help="start the configurations that won the most races of this size (from --log) first")
+    parser.add_argument('--only-preferred', action='store_true',
+                        help="run only the configuration that won the most races of this size")
+    args = parser.parse_args(arguments)
+
+    try:
+        initial_state = read_puzzle(args.puzzle, strict=True)
+    except PuzzleError as error:
+        parser.error(str(error))
+    configurations = args.configurations
+    preferences = learn_preferences(args.log) if args.log and (args.learned or args.only_preferred) else None
+    if args.only_preferred and preferences:
+        configurations = order_configurations(initial_state, configurations, preferences)[:1]
+    try:
+        winner, path, runtime = race(initial_state, configurations, args.workers, args.time_limit, preferences,
+                                     args.log)
+    except ValueError as error:
+        parser.error(str(error))
+    if winner is None:
+        print("No solution found.")
+        return 1
+    print(f"Winner: {winner}")
+    print(f"Runtime: {runtime:.5f} seconds")
+    print("Number of Moves: {}".format(len(path)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,320 @@
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+
+# Reading of puzzles written as "[[1,2,1],[2,1,2],[]]", the top of every tube first. The text is read in chunks and
+# split into tokens with a regular expression, the tubes are built straight into bytes (or tuples when a color does not
+# fit in a byte, like PackedPuzzle) and the amount of every color is counted on the way, so the puzzle is checked
+# without reading it again. A source is the puzzle itself, the path of a file holding it or "-" for stdin:
+#   read_puzzle("[[1,2,1],[2,1,2],[]]")
+#   read_puzzle("puzzle.txt")
+# Puzzles and solutions can also be kept in binary files read through mmap (see PuzzleFile and SolutionFile):
+#   python puzzle_io.py instances.py --output instances.lqpz
+
+# A number or any other single character, the whitespace between them is skipped
+TOKEN = re.compile(r'\d+|\S')
+CHUNK_SIZE = 1 << 16
+# The tokens the parser waits for, for the error messages
+EXPECTED = {'open': "'['", 'tube': "'['", 'color': "a color", 'separator': "',' or ']'"}
+
+
+class PuzzleError(ValueError):
+    pass
+
+
+# The text of a source in chunks
+def read_chunks(source, chunk_size=CHUNK_SIZE):
+    if hasattr(source, 'read'):
+        file = source
+    elif source == '-':
+        file = sys.stdin
+    elif source.lstrip().startswith('['):
+        yield source
+        return
+    elif os.path.isfile(source):
+        with open(source) as file:
+            yield from read_chunks(file, chunk_size)
+        return
+    else:
+        raise PuzzleError(f"{source[:40]!r} is not a puzzle or a file")
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+# The tokens of the chunks as (token, position), a number cut by the end of a chunk is joined with its rest
+def tokens(chunks):
+    position = 0
+    rest = ""
+    for chunk in chunks:
+        text = rest + chunk
+        # The digits at the end may go on in the next chunk
+        end = len(text.rstrip('0123456789'))
+        for match in TOKEN.finditer(text, 0, end):
+            yield match.group(), position + match.start()
+        position += end
+        rest = text[end:]
+    if rest:
+        yield rest, position
+
+
+# Parses a puzzle, returns (tubes, amounts), the tubes as bytes (tuples when a color is bigger than 255) and the amount
+# of units of every color. Any well formed puzzle is accepted, with strict every color also has to fill whole tubes
+# like in a puzzle that can be solved
+def parse_tubes(source, strict=False):
+    tubes = []
+    amounts = {}
+    tube = None
+    depth = 0
+    # What may come next: 'open' the puzzle, 'tube' a tube (or the end right after '['), 'color' a color (or the end
+    # right after '['), 'separator' a ',' or the end, 'end' nothing
+    expected = 'open'
+    first = False
+    for token, position in tokens(read_chunks(source)):
+        if expected == 'color' and token.isdigit():
+            color = int(token)
+            tube.append(color)
+            amounts[color] = amounts.get(color, 0) + 1
+            expected = 'separator'
+        elif expected == 'separator' and token == ',':
+            expected = 'color' if depth == 2 else 'tube'
+            first = False
+            continue
+        elif token == '[' and expected in ('open', 'tube'):
+            depth += 1
+            if depth == 2:
+                tube = []
+                expected = 'color'
+            else:
+                expected = 'tube'
+            first = True
+            continue
+        elif token == ']' and (expected == 'separator' or (first and expected in ('tube', 'color'))):
+            depth -= 1
+            if depth == 1:
+                tubes.append(tube)
+                expected = 'separator'
+            else:
+                expected = 'end'
+        else:
+            if expected == 'end':
+                raise PuzzleError(f"Unexpected {token!r} after the end of the puzzle at character {position}")
+            wanted = EXPECTED[expected] + (" or ']'" if first and expected in ('tube', 'color') else "")
+            if depth == 2:
+                raise PuzzleError(f"Tube {len(tubes) + 1}: expected {wanted} but found {token!r} at character "
+                                  f"{position}")
+            raise PuzzleError(f"Expected {wanted} but found {token!r} at character {position}")
+        first = False
+    if expected != 'end':
+        raise PuzzleError(f"The puzzle ends inside tube {len(tubes) + 1}" if depth == 2 else
+                          "The puzzle ends before its last ']'")
+
+    if strict:
+        check_amounts(amounts, max((len(tube) for tube in tubes), default=0))
+    if all(color < 256 for color in amounts):
+        return [bytes(tube) for tube in tubes], amounts
+    return [tuple(tube) for tube in tubes], amounts
+
+
+# Checks that every color of a puzzle fills whole tubes
+def check_amounts(amounts, tube_size):
+    for color, amount in sorted(amounts.items()):
+        if amount % tube_size:
+            raise PuzzleError(f"Color {color} has {amount} units, it does not fill tubes of size {tube_size}")
+
+
+# Reads a puzzle into a PackedPuzzle
+def read_puzzle(source, strict=False):
+    from main import PackedPuzzle
+
+    tubes, amounts = parse_tubes(source, strict)
+    return PackedPuzzle(tuple(tubes), len(amounts), max((len(tube) for tube in tubes), default=0))
+
+
+# Binary puzzle file, a container of puzzles, all numbers little endian:
+#   header: magic, version, amount of puzzles (u64), then the offset of every puzzle in the file (u64)
+#   puzzle: tubes (u32), tube size (u16), colors (u32), cell size (u8, 1 or 2 bytes), then tubes * tube size cells,
+#     every tube from its top with the empty cells at its end holding the PAD of the cell size
+PUZZLE_MAGIC = b'LQPZ'
+SOLUTION_MAGIC = b'LQSL'
+BINARY_VERSION = 1
+FILE_HEADER = struct.Struct('<4sHxxQ')
+PUZZLE_HEADER = struct.Struct('<IHIBx')
+OFFSET = struct.Struct('<Q')
+PADS = {1: 0xFF, 2: 0xFFFF}
+# Solution file: header (magic, version, amount of moves), then every move as (tube_from, tube_to, amount) in u16
+MOVE = struct.Struct('<HHH')
+
+
+# The bytes of a puzzle record
+def encode_puzzle(puzzle):
+    largest = max((color for tube in puzzle.tubes for color in tube), default=0)
+    if largest < PADS[1]:
+        cell_size, code = 1, 'B'
+    elif largest < PADS[2]:
+        cell_size, code = 2, 'H'
+    else:
+        raise PuzzleError(f"Color {largest} does not fit in a binary puzzle file")
+    if len(puzzle.tubes) >= 1 << 32 or puzzle.tube_size >= 1 << 16:
+        raise PuzzleError("The puzzle is too big for a binary puzzle file")
+    pad = [PADS[cell_size]]
+    cells = []
+    for tube in puzzle.tubes:
+        cells += list(tube) + pad * (puzzle.tube_size - len(tube))
+    body = struct.pack(f"<{len(cells)}{code}", *cells)
+    return PUZZLE_HEADER.pack(len(puzzle.tubes), puzzle.tube_size, puzzle.colors, cell_size) + body
+
+
+# Writes puzzles (PackedPuzzle or LiquidPuzzle) to a binary puzzle file
+def write_puzzles(path, puzzles):
+    records = [encode_puzzle(puzzle) for puzzle in puzzles]
+    offset = FILE_HEADER.size + OFFSET.size * len(records)
+    with open(path + ".tmp", 'wb') as file:
+        file.write(FILE_HEADER.pack(PUZZLE_MAGIC, BINARY_VERSION, len(records)))
+        for record in records:
+            file.write(OFFSET.pack(offset))
+            offset += len(record)
+        for record in records:
+            file.write(record)
+    os.replace(path + ".tmp", path)
+
+
+# A binary file opened with mmap, the records are memoryviews of the map so nothing is copied until a puzzle is built
+class BinaryFile:
+    magic = None
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        # mmap can not map an empty file, a file without a whole header is not a binary file anyway
+        if os.fstat(self.file.fileno()).st_size < FILE_HEADER.size:
+            self.file.close()
+            raise PuzzleError(f"{path} is not a {self.kind} file")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic, version, self.length = FILE_HEADER.unpack_from(self.map)
+        if magic != self.magic or version != BINARY_VERSION:
+            self.close()
+            raise PuzzleError(f"{path} is not a {self.kind} file")
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return (self[index] for index in range(self.length))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # Views of the records are still in use, the map is closed once they are released
+            pass
+        self.file.close()
+
+
+class PuzzleFile(BinaryFile):
+    magic = PUZZLE_MAGIC
+    kind = "binary puzzle"
+
+    # (tubes, tube size, colors, cells), the cells as a memoryview of the file (of unsigned shorts with 2 byte cells)
+    def record(self, index):
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        offset, = OFFSET.unpack_from(self.map, FILE_HEADER.size + OFFSET.size * index)
+        tubes_amount, tube_size, colors, cell_size = PUZZLE_HEADER.unpack_from(self.map, offset)
+        start = offset + PUZZLE_HEADER.size
+        cells = self.view[start:start + tubes_amount * tube_size * cell_size]
+        if cell_size == 2:
+            cells = cells.cast('H') if sys.byteorder == 'little' else memoryview(bytes(cells)).cast('H')
+        return tubes_amount, tube_size, colors, cells
+
+    # The puzzle at index as a PackedPuzzle
+    def __getitem__(self, index):
+        from main import PackedPuzzle
+
+        tubes_amount, tube_size, colors, cells = self.record(index)
+        pad = PADS[cells.itemsize]
+        tubes = []
+        for start in range(0, tubes_amount * tube_size, tube_size):
+            tube = cells[start:start + tube_size]
+            if cells.itemsize == 1:
+                tubes.append(bytes(tube).rstrip(b'\xff'))
+            else:
+                tube = tube.tolist()
+                while tube and tube[-1] == pad:
+                    tube.pop()
+                tubes.append(tuple(tube))
+        if cells.itemsize == 2 and all(color < 256 for tube in tubes for color in tube):
+            tubes = [bytes(tube) for tube in tubes]
+        return PackedPuzzle(tuple(tubes), colors, tube_size)
+
+
+# Writes the moves of a solution, (tube_from, tube_to, amount), to a binary solution file
+def write_solution(path, moves):
+    with open(path + ".tmp", 'wb') as file:
+        file.write(FILE_HEADER.pack(SOLUTION_MAGIC, BINARY_VERSION, len(moves)))
+        for move in moves:
+            file.write(MOVE.pack(*move))
+    os.replace(path + ".tmp", path)
+
+
+# The moves of a binary solution file, solution[index] is (tube_from, tube_to, amount), moves is a memoryview of
+# unsigned shorts over the file (three per move)
+class SolutionFile(BinaryFile):
+    magic = SOLUTION_MAGIC
+    kind = "binary solution"
+
+    def __init__(self, path):
+        super().__init__(path)
+        moves = self.view[FILE_HEADER.size:FILE_HEADER.size + MOVE.size * self.length]
+        self.moves = moves.cast('H') if sys.byteorder == 'little' else None
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        if self.moves is not None:
+            return tuple(self.moves[index * 3:index * 3 + 3])
+        return MOVE.unpack_from(self.map, FILE_HEADER.size + MOVE.size * index)
+
+    def close(self):
+        if self.moves is not None:
+            self.moves.release()
+        super().close()
+
+
+def main(arguments=None):
+    from batch import read_instances
+
+    parser = argparse.ArgumentParser(description="Convert puzzles to a binary puzzle file")
+    parser.add_argument('sources', nargs='+',
+                        help="files in the instances.py format, puzzles, files holding a puzzle or - for stdin")
+    parser.add_argument('--output', required=True, help="the binary puzzle file")
+    args = parser.parse_args(arguments)
+
+    puzzles = []
+    try:
+        for source in args.sources:
+            if os.path.isfile(source) and source.endswith(".py"):
+                puzzles += [read_puzzle(instance['init']) for instance in read_instances(source)]
+            else:
+                puzzles.append(read_puzzle(source))
+        write_puzzles(args.output, puzzles)
+    except PuzzleError as error:
+        parser.error(str(error))
+    print(f"{len(puzzles)} puzzles, {os.path.getsize(args.output)} bytes")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import argparse
+import sys
+import time
+
+from main import (IncrementalHeuristic, custom_heuristic, heuristic, heuristic_first, heuristic_second,
+                  heuristic_third)
+from puzzle_io import PuzzleError, read_puzzle
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Batch evaluation of heuristic_first, heuristic_second, heuristic_third and custom_heuristic with NumPy. The states of
+# a batch are a 3-D array of cells (state x tube x slot, the top of every tube first and the empty slots holding PAD),
+# and every heuristic is computed for the whole batch at once from the runs of equal colors in the tubes, giving the
+# exact values of the scalar functions. The successors of an expansion differ from their parent in two tubes only, so
+# their array is a copy of the array of the parent with those tubes written over (see successor_cells).
+# a_star scores the successors of every expansion with a single call when the heuristic is a BatchHeuristic, they are
+# registered as heuristic_first_batch, heuristic_second_batch, heuristic_third_batch and custom_heuristic_batch.
+# Without NumPy they score the states one at a time with the scalar functions. Compares both on the successors of a
+# puzzle:
+#   python vector_heuristics.py "[[1,2,1],[2,1,2],[]]"
+
+PAD = -1
+# The weights of custom_tube_score
+CUSTOM_EMPTY = 10
+CUSTOM_TOP_BOTTOM = 1 + 1
+CUSTOM_CONSISTENCY = 5
+CUSTOM_SEQUENCE = 3
+
+
+# The padded cells of a list of tubes as a 2-D array (tube x slot)
+def tube_rows(tubes, tube_size):
+    if all(isinstance(tube, bytes) for tube in tubes):
+        data = b''.join(tube + b'\0' * (tube_size - len(tube)) for tube in tubes)
+        rows = numpy.frombuffer(data, dtype=numpy.uint8).astype(numpy.int16)
+    else:
+        rows = numpy.array([color for tube in tubes for color in list(tube) + [0] * (tube_size - len(tube))],
+                           dtype=numpy.int32)
+    rows = rows.reshape(len(tubes), tube_size)
+    lengths = numpy.array([len(tube) for tube in tubes], dtype=numpy.int32)
+    rows[numpy.arange(tube_size) >= lengths[:, None]] = PAD
+    return rows, lengths
+
+
+# (cells, lengths) of states with the same amount of tubes and tube size
+def state_cells(states):
+    tube_size = states[0].tube_size
+    rows, lengths = tube_rows([tube for state in states for tube in state.tubes], tube_size)
+    return rows.reshape(len(states), -1, tube_size), lengths.reshape(len(states), -1)
+
+
+# (cells, lengths) of the successors of a state, neighbors[index] is the state reached by moves[index]
+def successor_cells(state, moves, neighbors):
+    parent, parent_lengths = tube_rows(state.tubes, state.tube_size)
+    cells = numpy.repeat(parent[None], len(neighbors), axis=0)
+    lengths = numpy.repeat(parent_lengths[None], len(neighbors), axis=0)
+    index = numpy.repeat(numpy.arange(len(neighbors)), 2)
+    changed = numpy.array([tube for tube_from, tube_to, amount in moves for tube in (tube_from, tube_to)],
+                          dtype=numpy.intp)
+    rows, row_lengths = tube_rows([neighbor.tubes[tube] for neighbor, (tube_from, tube_to, amount)
+                                   in zip(neighbors, moves) for tube in (tube_from, tube_to)], state.tube_size)
+    cells[index, changed] = rows
+    lengths[index, changed] = row_lengths
+    return cells, lengths
+
+
+# The slots that start a run of equal colors, the top of every tube and every color on a different one
+def run_starts(cells):
+    starts = numpy.ones(cells.shape, dtype=bool)
+    numpy.not_equal(cells[..., 1:], cells[..., :-1], out=starts[..., 1:])
+    starts &= cells != PAD
+    return starts
+
+
+# The streak of the top and of the bottom of every tube, from the first run start below the top and the last one
+def streaks(starts, runs, lengths):
+    if starts.shape[-1] > 1:
+        top = numpy.where(runs > 1, numpy.argmax(starts[..., 1:], axis=-1) + 1, lengths)
+    else:
+        top = lengths
+    last = starts.shape[-1] - 1 - numpy.argmax(starts[..., ::-1], axis=-1)
+    return top, numpy.where(lengths > 0, lengths - last, 0)
+
+
+def first_scores(cells, lengths, tube_size):
+    runs = numpy.count_nonzero(run_starts(cells), axis=-1)
+    # a mixed tube has to be emptied, a tube of a single color has to be filled
+    scores = numpy.where(runs > 1, 1 + lengths, tube_size - lengths)
+    return numpy.where(lengths == 0, 0, scores).sum(axis=-1)
+
+
+def second_scores(cells, lengths, tube_size):
+    non_empty = (lengths > 0).sum(axis=-1)
+    changes = numpy.count_nonzero(run_starts(cells), axis=(-1, -2)) - non_empty
+    # the distinct bottom colors, the empty tubes have PAD at the bottom and are sorted first
+    bottoms = numpy.take_along_axis(cells, numpy.maximum(lengths - 1, 0)[..., None], axis=-1)[..., 0]
+    bottoms = numpy.sort(numpy.where(lengths > 0, bottoms, PAD), axis=-1)
+    distinct = (bottoms[:, 0] != PAD) + ((bottoms[:, 1:] != bottoms[:, :-1]) & (bottoms[:, 1:] != PAD)).sum(axis=-1)
+    return changes + non_empty - distinct
+
+
+def third_scores(cells, lengths, tube_size):
+    starts = run_starts(cells)
+    top, bottom = streaks(starts, numpy.count_nonzero(starts, axis=-1), lengths)
+    # Rule 2, the bottom streak of every tube
+    rule_two = (tube_size - bottom).sum(axis=-1)
+    # Rule 1, 2 to the power of the top streaks of every top color (a solid tube of more than a unit adds nothing),
+    # the tubes are sorted by their top color and the streaks are summed over every group of equal colors
+    values = numpy.where((top == lengths) & (lengths > 1), 0, top)
+    colors = numpy.where(lengths > 0, cells[..., 0], PAD)
+    order = numpy.argsort(colors, axis=-1, kind='stable')
+    colors = numpy.take_along_axis(colors, order, axis=-1)
+    totals = numpy.cumsum(numpy.take_along_axis(values, order, axis=-1), axis=-1)
+    ends = numpy.ones(colors.shape, dtype=bool)
+    ends[:, :-1] = colors[:, 1:] != colors[:, :-1]
+    before = numpy.zeros(totals.shape, dtype=totals.dtype)
+    before[:, 1:] = numpy.maximum.accumulate(numpy.where(ends, totals, 0), axis=-1)[:, :-1]
+    totals -= before
+    ends &= colors != PAD
+    if totals[ends].max(initial=0) < 62 - totals.shape[-1].bit_length():
+        return numpy.where(ends, numpy.left_shift(1, totals), 0).sum(axis=-1) + rule_two
+    # The powers do not fit in 64 bits, they are summed as Python integers
+    rule_one = [sum(1 << int(total) for total in row[row_ends]) for row, row_ends in zip(totals, ends)]
+    return [one + two for one, two in zip(rule_one, rule_two.tolist())]
+
+
+def custom_scores(cells, lengths, tube_size):
+    starts = run_starts(cells)
+    # Every unit that continues a run gets CUSTOM_CONSISTENCY and CUSTOM_SEQUENCE times its place in the run (the
+    # distance to the first slot of the run)
+    slots = numpy.arange(cells.shape[-1], dtype=numpy.int16 if tube_size < 1 << 15 else numpy.int32)
+    place = slots - numpy.maximum.accumulate(numpy.where(starts, slots, slots.dtype.type(0)), axis=-1)
+    places = numpy.where(starts | (cells == PAD), 0, place).sum(axis=(-1, -2))
+    continuing = lengths.sum(axis=-1) - numpy.count_nonzero(starts, axis=(-1, -2))
+    empty = (lengths == 0).sum(axis=-1)
+    return (CUSTOM_EMPTY * empty - CUSTOM_TOP_BOTTOM * (lengths.shape[-1] - empty) - CUSTOM_CONSISTENCY * continuing
+            - CUSTOM_SEQUENCE * places)
+
+
+# The batch version of every heuristic
+BATCH_FUNCTIONS = {
+    heuristic_first: first_scores,
+    heuristic_second: second_scores,
+    heuristic_third: third_scores,
+    custom_heuristic: custom_scores,
+    heuristic: custom_scores,
+}
+
+
+# The values of a heuristic for a list of states, scored together when the heuristic has a batch version and NumPy is
+# installed
+def score_states(function, states):
+    batch = BATCH_FUNCTIONS.get(function)
+    if numpy is None or batch is None or not states:
+        return [function(state) for state in states]
+    cells, lengths = state_cells(states)
+    return list(map(int, batch(cells, lengths, states[0].tube_size)))
+
+
+# A heuristic that scores the successors of an expansion with a single call of its batch version (see run_a_star).
+# The data of a state is its value, a single state is scored with the scalar function
+class BatchHeuristic(IncrementalHeuristic):
+    batched = True
+
+    def __init__(self, function, name=None):
+        super().__init__(function, name or f"{function.__name__}_batch")
+        self.batch = BATCH_FUNCTIONS[function]
+
+    # The data of the neighbors of a state, neighbors[index] is the state reached by moves[index]
+    def after_pours(self, state, moves, neighbors):
+        if numpy is None or not neighbors:
+            return [self.function(neighbor) for neighbor in neighbors]
+        cells, lengths = successor_cells(state, moves, neighbors)
+        return list(map(int, self.batch(cells, lengths, state.tube_size)))
+
+
+heuristic_first_batch = BatchHeuristic(heuristic_first)
+heuristic_second_batch = BatchHeuristic(heuristic_second)
+heuristic_third_batch = BatchHeuristic(heuristic_third)
+custom_heuristic_batch = BatchHeuristic(custom_heuristic)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Score the successors of a puzzle one at a time and as a batch")
+    parser.add_argument('puzzle', help="the puzzle, for example \"[[1,2,1],[2,1,2],[]]\", a file holding it or - for "
+                                       "stdin")
+    parser.add_argument('--repeat', type=int, default=100, help="times every evaluation is run")
+    args = parser.parse_args(arguments)
+
+    try:
+        puzzle = read_puzzle(args.puzzle, strict=True)
+    except PuzzleError as error:
+        parser.error(str(error))
+    moves = list(puzzle.get_moves())
+    neighbors = [puzzle.pour(*move) for move in moves]
+    if numpy is None:
+        print("NumPy is not installed, the batch heuristics score the states one at a time")
+    print(f"Successors: {len(neighbors)}")
+    for batch_heuristic in (heuristic_first_batch, heuristic_second_batch, heuristic_third_batch,
+                            custom_heuristic_batch):
+        start_time = time.perf_counter()
+        for _ in range(args.repeat):
+            scalar = [batch_heuristic.function(neighbor) for neighbor in neighbors]
+        scalar_time = (time.perf_counter() - start_time) / args.repeat
+        start_time = time.perf_counter()
+        for _ in range(args.repeat):
+            batch = batch_heuristic.after_pours(puzzle, moves, neighbors)
+        batch_time = (time.perf_counter() - start_time) / args.repeat
+        print(f"{batch_heuristic.function.__name__:<20} scalar {scalar_time * 1e3:9.3f} ms  batch "
+              f"{batch_time * 1e3:9.3f} ms  {'match' if scalar == batch else 'MISMATCH'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -21,6 +21,15 @@ class LiquidPuzzle:
             raise ValueError("Invalid puzzle configuration")
         self.tube_size = max(len(tube) for tube in self.tubes)
 
+    # Builds the puzzle of a move, the tubes come from a valid puzzle so they are not parsed or checked again
+    @staticmethod
+    def from_tubes(tubes, colors, tube_size):
+        puzzle = LiquidPuzzle.__new__(LiquidPuzzle)
+        puzzle.tubes = tubes
+        puzzle.colors = colors
+        puzzle.tube_size = tube_size
+        return puzzle
+
     def is_valid_move(self, tube_from, tube_to, reverse=False):
         if not self.tubes[tube_from]:
             return False
@@ -41,7 +50,7 @@ class LiquidPuzzle:
             while new_tubes[tube_from] and (len(new_tubes[tube_to]) < self.tube_size) and (not new_tubes[tube_to] or new_tubes[tube_from][-1] == new_tubes[tube_to][-1]):
                 new_tubes[tube_to].append(new_tubes[tube_from].pop())
                 count += 1
-            return LiquidPuzzle.from_puzzle(new_tubes), count
+            return LiquidPuzzle.from_tubes(new_tubes, self.colors, self.tube_size), count
         return None, 0
 
     def get_neighbors(self):
@@ -73,8 +82,9 @@ class LiquidPuzzle:
 
     @staticmethod
     def from_puzzle(puzzle):
-        puzzle_str = '[' + '],['.join([','.join(map(str, tube)) if tube else '' for tube in puzzle]) + ']'
-        return LiquidPuzzle(puzzle_str)
+        colors = len({color for tube in puzzle for color in tube})
+        tube_size = max((len(tube) for tube in puzzle), default=0)
+        return LiquidPuzzle.from_tubes([list(tube) for tube in puzzle], colors, tube_size)
 
     def is_goal(self):
         for tube in self.tubes:
@@ -148,6 +158,11 @@ def heuristic(puzzle):
 
     return heuristic_value
 
+# heuristic for the puzzles of main.py (the 'workplace_1' heuristic of its registry), their tubes hold the top first so
+# they are reversed to the bottom first tubes of this file
+def top_first_heuristic(puzzle):
+    return heuristic(LiquidPuzzle.from_tubes([tube[::-1] for tube in puzzle.tubes], puzzle.colors, puzzle.tube_size))
+
 def a_star(initial_state):
     open_set = PriorityQueue()
     open_set.put((0, initial_state))
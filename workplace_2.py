@@ -41,6 +41,16 @@ class LiquidPuzzle:
         if not construct_correctness(self.tubes):
             raise ValueError("Invalid puzzle configuration")
         self.tube_size = max(len(tube) for tube in self.tubes)
+        self.colors = len({color for tube in self.tubes for color in tube})
+
+    # Builds the puzzle of a move, the tubes come from a valid puzzle so they are not parsed or checked again
+    @staticmethod
+    def from_tubes(tubes, colors, tube_size):
+        puzzle = LiquidPuzzle.__new__(LiquidPuzzle)
+        puzzle.tubes = tubes
+        puzzle.colors = colors
+        puzzle.tube_size = tube_size
+        return puzzle
 
     def is_valid_move(self, tube_from, tube_to):
         if not self.tubes[tube_from] or len(self.tubes[tube_to]) >= self.tube_size:
@@ -53,7 +63,7 @@ class LiquidPuzzle:
         if self.is_valid_move(tube_from, tube_to):
             new_tubes = [list(tube) for tube in self.tubes]
             new_tubes[tube_to].append(new_tubes[tube_from].pop())
-            return LiquidPuzzle.from_puzzle(new_tubes)
+            return LiquidPuzzle.from_tubes(new_tubes, self.colors, self.tube_size)
         return None
 
     def get_neighbors(self):
@@ -70,8 +80,9 @@ class LiquidPuzzle:
 
     @staticmethod
     def from_puzzle(puzzle):
-        puzzle_str = ''.join(['[' + ','.join(map(str, tube)) + ']' for tube in puzzle])
-        return LiquidPuzzle(puzzle_str)
+        colors = len({color for tube in puzzle for color in tube})
+        tube_size = max((len(tube) for tube in puzzle), default=0)
+        return LiquidPuzzle.from_tubes([list(tube) for tube in puzzle], colors, tube_size)
 
     def is_goal(self):
         for tube in self.tubes:
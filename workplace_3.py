@@ -1,5 +1,7 @@
 import random
 
+from puzzle_io import parse_tubes
+
 
 class liquidPuzzle:
     correctInput = False
@@ -51,46 +53,10 @@ class liquidPuzzle:
         self.setTubeSize(maxTube)
         return True
 
-    # Constructs the puzzle given be the user and returns it
-    # Currently only works on correct input, returns puzzle
+    # Constructs the puzzle given be the user and returns it, see puzzle_io for the format, returns puzzle
     def constructPuzzle(self, string):
-        # Remove all whitespaces in the string for easier processing
-        string = string.replace(" ", "")
-        # just some auxiliary variables
-        puzzle = []
-        Skip, tempFirst, AddToTemp = False, 0, True
-        # We shall now go over all internal lists
-        for i in range(1, len(string) - 1):
-            # This skip a turn if found an empty internal array
-            if Skip:
-                Skip = False
-                continue
-            # check if it is an empty array
-            if string[i] == '[' and string[i + 1] == ']':
-                puzzle.append([])
-                Skip = True
-            # Check if it is the beginning of full array
-            elif string[i] == '[' and string[i + 1] != ']':
-                AddToTemp = True
-                tempFirst = i + 1
-                continue
-            # Check if we are in between two internal arrays
-            elif string[i] == ',' and not AddToTemp:
-                continue
-            # Check if we are in the middle of an internal array
-            elif string[i] != ']' and AddToTemp:
-                continue
-            # if we finished an internal array we add it to the puzzle as new list
-            else:
-                AddToTemp = False
-                # cut out the internal array and turn it into an a list of integers
-                cut_str = string[tempFirst:i]
-                cut_str = cut_str.split(",")
-                for j in range(len(cut_str)):
-                    cut_str[j] = int(cut_str[j])
-                # Add it to the final product
-                puzzle.append(cut_str)
-        return puzzle
+        tubes = parse_tubes(string)[0]
+        return [list(tube) for tube in tubes]
 
     # Given a move from the user we first have to check it it is a possible move, this work foe value from 0 to tubes-1
     # for ease of use later in the heuristic, returns Boolean